@@ -1,14 +1,30 @@
 import os
 import psycopg2
 import psycopg2.extras
-from flask import Flask, jsonify, request, send_from_directory, render_template, make_response, session
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+from cachetools import TTLCache
+from flask import Flask, Response, abort, jsonify, request, send_from_directory, render_template, make_response, session, stream_with_context
 from dotenv import load_dotenv
+from flask.json.provider import DefaultJSONProvider, JSONProvider
 from flask_cors import CORS
+from jinja2 import FileSystemBytecodeCache
+from werkzeug.security import check_password_hash, generate_password_hash
 import datetime
-import traceback
+import logging
+import select
+import time
+import logging.handlers
+import queue
+import atexit
+import base64
 import decimal
+import hashlib
+import hmac
 import json 
-import collections 
+import orjson
+import collections
+import contextlib
+import threading
 import jwt # Importa JWT para tokens de login
 from functools import wraps # Importa 'wraps' para os decoradores de login
 import string # [NOVO] Para gerar o código de acesso
@@ -20,63 +36,277 @@ import google.generativeai as genai
 # Carrega variáveis de ambiente
 load_dotenv()
 
+# Logging (nível em LOG_LEVEL): a mensagem só é formatada se o nível estiver ativo.
+# O request apenas enfileira o registro; a escrita no stderr fica com a thread do QueueListener.
+_log_saida = logging.StreamHandler()
+_log_saida.setFormatter(logging.Formatter('%(asctime)s %(levelname)s [%(name)s] %(message)s'))
+_log_entrada = logging.handlers.QueueHandler(queue.Queue())
+_log_entrada.setFormatter(logging.Formatter('%(message)s'))
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'), handlers=[_log_entrada])
+log = logging.getLogger('oceano')
+
+# A thread do listener é iniciada por processo (primeiro request ou post_worker_init do gunicorn):
+# um fork depois do import (gunicorn --preload) herda a fila, mas não a thread que a esvazia.
+# Até o listener subir, os registros ficam guardados na fila.
+_log_listener = None
+_log_listener_pid = None
+_log_listener_lock = threading.Lock()
+
+def iniciar_log_listener():
+    """Garante um QueueListener rodando neste processo (idempotente; barato no caminho do request)."""
+    global _log_listener, _log_listener_pid
+    if _log_listener_pid == os.getpid():
+        return
+    with _log_listener_lock:
+        if _log_listener_pid == os.getpid():
+            return
+        _log_listener = logging.handlers.QueueListener(_log_entrada.queue, _log_saida)
+        _log_listener.start()
+        _log_listener_pid = os.getpid()
+
+def _log_apos_fork():
+    """No processo filho: fila própria, e o listener será iniciado de novo por iniciar_log_listener()."""
+    global _log_listener, _log_listener_pid
+    herdada = _log_entrada.queue
+    nova = queue.Queue()
+    if _log_listener_pid is None:
+        # Ninguém esvaziava a fila no pai (ex.: master do --preload): os registros pendentes,
+        # como os avisos do import, passam para este processo em vez de se perderem
+        for registro in list(herdada.queue):
+            nova.put_nowait(registro)
+    _log_entrada.queue = nova
+    _log_listener = None
+    _log_listener_pid = None
+
+def _parar_log_listener():
+    # Só o processo que iniciou o listener o encerra (escreve o que faltou na fila antes de sair)
+    if _log_listener is not None and _log_listener_pid == os.getpid():
+        _log_listener.stop()
+
+os.register_at_fork(after_in_child=_log_apos_fork)
+atexit.register(_parar_log_listener)
+
 app = Flask(__name__, static_folder='static', static_url_path='/static', template_folder='templates')
 CORS(app) 
+app.before_request(iniciar_log_listener)
 
 # Configuração de Chave Secexta para JWT
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'sua-chave-secreta-padrao-mude-isso')
+PORT = int(os.getenv('PORT', 10000))
+# Arquivos estáticos (rota /static e fallback): o navegador reaproveita por 1 dia e revalida com 304
+app.config['SEND_FILE_MAX_AGE_DEFAULT'] = int(os.getenv('STATIC_MAX_AGE', 86400))
+
+# Templates: o bytecode compilado do Jinja fica em disco e sobrevive ao restart dos workers
+# (JINJA_CACHE_DIR; sem ela o Jinja usa uma pasta temporária própria)
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory=os.getenv('JINJA_CACHE_DIR'))
 
 # --- [NOVO] Configuração do Gemini (Chatbot) ---
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 if not GEMINI_API_KEY:
-    print("AVISO: GEMINI_API_KEY não encontrada. O Chatbot não funcionará.")
+    log.warning("AVISO: GEMINI_API_KEY não encontrada. O Chatbot não funcionará.")
 else:
     try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        print("✅ [IA] Gemini configurado com sucesso.")
+        # Transporte REST (requests/sockets do Python): com workers gevent as chamadas ao Gemini, inclusive
+        # o streaming do chat, cedem a vez aos outros greenlets. O gRPC padrão espera fora do loop do gevent
+        # e travaria todas as requisições do worker durante a geração.
+        genai.configure(api_key=GEMINI_API_KEY, transport='rest')
+        log.info("✅ [IA] Gemini configurado com sucesso.")
     except Exception as e:
-        print(f"ERRO ao configurar Gemini: {e}")
+        log.error("ERRO ao configurar Gemini: %s", e)
 
 # =====================================================================
 # --- CONEXÃO COM BANCO E HELPERS ---
 # =====================================================================
 
+# Pool de conexões compartilhado entre as requisições do worker.
+# É criado na primeira utilização (e não no import) para que o app suba mesmo sem banco.
+DATABASE_URL = os.getenv('DATABASE_URL')
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', 2))
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', 20))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))
+_db_pool = None
+_db_pool_lock = threading.Lock()
+# O ThreadedConnectionPool dá erro quando todas as conexões estão em uso; o semáforo faz
+# a requisição esperar por uma conexão livre (importante com workers gevent, muitas por processo)
+_db_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+
+class OceanoConnection(psycopg2.extensions.connection):
+    """Conexão do pool que registra os prepared statements já criados na sessão."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+
+# Colunas json/jsonb (ex.: especificacoes_tecnicas) são convertidas em dict pelo orjson
+psycopg2.extras.register_default_json(globally=True, loads=orjson.loads)
+psycopg2.extras.register_default_jsonb(globally=True, loads=orjson.loads)
+
+def get_db_pool():
+    """Retorna o pool de conexões do PostgreSQL, criando-o na primeira chamada."""
+    global _db_pool
+    if _db_pool is None:
+        with _db_pool_lock:
+            if _db_pool is None:
+                if not DATABASE_URL:
+                    log.critical("ERRO CRÍTICO: Variável de ambiente DATABASE_URL não encontrada.")
+                    raise ValueError("DATABASE_URL não configurada")
+                _db_pool = ThreadedConnectionPool(minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX, dsn=DATABASE_URL,
+                                                  connection_factory=OceanoConnection)
+                # Encerra as conexões de forma limpa quando o worker termina
+                atexit.register(_db_pool.closeall)
+                # Junto com o pool, o worker passa a ouvir as alterações de catálogo feitas pelos outros
+                threading.Thread(target=ouvir_alteracoes_catalogo, name='oceano-catalogo', daemon=True).start()
+    return _db_pool
+
+@contextlib.contextmanager
 def get_db_connection():
-    """Cria e retorna uma conexão com o banco de dados PostgreSQL."""
-    conn = None
+    """Empresta uma conexão do pool e a devolve ao final do bloco 'with'."""
+    if not _db_pool_slots.acquire(timeout=DB_POOL_TIMEOUT):
+        log.critical("ERRO CRÍTICO: Tempo esgotado esperando uma conexão livre no pool.")
+        raise PoolError("Nenhuma conexão livre no pool")
     try:
-        db_url = os.getenv('DATABASE_URL')
-        if not db_url:
-            print("ERRO CRÍTICO: Variável de ambiente DATABASE_URL não encontrada.")
-            raise ValueError("DATABASE_URL não configurada")
-            
-        conn = psycopg2.connect(db_url)
-        return conn
-    except Exception as e:
-        print(f"ERRO CRÍTICO: Não foi possível conectar ao banco de dados: {e}")
-        raise
-
-def format_db_data(data_dict):
-    """Formata dados do banco (datas, decimais) para serem compatíveis com JSON."""
-    if not isinstance(data_dict, dict):
-        return data_dict
-
-    formatted_dict = {}
-    for key, value in data_dict.items():
-        if isinstance(value, (datetime.datetime, datetime.date)):
-            formatted_dict[key] = value.isoformat() if value else None
-        elif isinstance(value, datetime.time):
-            formatted_dict[key] = value.strftime('%H:%M') if value else None
-        elif isinstance(value, decimal.Decimal):
-            try:
-                formatted_dict[key] = float(value)
-            except (TypeError, ValueError):
-                formatted_dict[key] = None
-        elif isinstance(value, list):
-            formatted_dict[key] = value
-        else:
-            formatted_dict[key] = value
-    return formatted_dict
+        try:
+            pool = get_db_pool()
+            conn = pool.getconn()
+        except Exception as e:
+            log.critical("ERRO CRÍTICO: Não foi possível conectar ao banco de dados: %s", e)
+            raise
+        descartar = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # Conexão derrubada pelo servidor (restart, idle timeout): não volta para o pool
+            descartar = True
+            raise
+        finally:
+            # O pool desfaz transações pendentes (rollback) e descarta conexões quebradas
+            pool.putconn(conn, close=descartar or bool(conn.closed))
+    finally:
+        _db_pool_slots.release()
+
+# Colunas usadas pela página de detalhe (oceano-produto-detalhe.html), em vez de SELECT *
+PRODUTO_DETALHE_COLUNAS = (
+    "id, nome_produto, codigo_produto, whatsapp_link_texto, descricao_curta, descricao_longa, "
+    "especificacoes_tecnicas, imagem_principal_url, imagem_principal_alt, galeria_imagens, "
+    "categoria, subcategoria, url_slug, meta_title, meta_description"
+)
+
+# Consultas quentes preparadas uma vez por conexão: o PostgreSQL pula o parse/plan a cada EXECUTE.
+# Formato: nome -> (tipos dos parâmetros ('' se não houver), SQL com $1, $2...)
+PREPARED_STATEMENTS = {
+    # $1 = lista de slugs candidatos, em ordem de preferência
+    'produto_by_slug': ('text[]', 'SELECT ' + PRODUTO_DETALHE_COLUNAS + ' FROM oceano_produtos '
+                                  'WHERE url_slug = ANY($1) ORDER BY array_position($1, url_slug) LIMIT 1'),
+    # Menu dinâmico (inject_dynamic_menu): $1 = categorias do menu. Os produtos já vêm agrupados
+    # por categoria/subcategoria em JSON, com o link final pronto. O filtro repete o WHERE do índice
+    # parcial ix_oceano_produtos_menu (migração 003): o plano genérico não o deduz do "= ANY($1)"
+    'menu_produtos': ('text[]', """
+        SELECT categoria, subcategoria,
+               json_agg(json_build_object(
+                   'nome', nome_produto,
+                   'url', CASE WHEN url_slug LIKE '/produtos/%' THEN url_slug ELSE '/produtos/' || url_slug END
+               ) ORDER BY nome_produto) AS produtos
+        FROM oceano_produtos 
+        WHERE categoria IS NOT NULL AND categoria != '' AND url_slug IS NOT NULL AND url_slug != ''
+          AND categoria = ANY($1)
+        GROUP BY categoria, subcategoria
+        ORDER BY categoria, subcategoria"""),
+    # Login do admin (admin_login)
+    'admin_by_username': ('text', 'SELECT id, username, chave_admin FROM oceano_admin WHERE username = $1'),
+    # Login do portal do cliente (cliente_login)
+    'cliente_by_codigo': ('text', 'SELECT id, nome_cliente FROM oceano_clientes WHERE codigo_acesso = $1'),
+    # Contadores do dashboard do cliente: orçamentos aguardando pagamento, pedidos em produção
+    # e pedidos enviados/prontos (os de pedidos em uma só passada, com FILTER)
+    'cliente_dashboard': ('integer', """
+        SELECT
+            (SELECT COUNT(id) FROM oceano_orcamentos
+             WHERE cliente_id = $1 AND status = 'Aguardando Pagamento'),
+            COUNT(id) FILTER (WHERE status = 'Em Produção'),
+            COUNT(id) FILTER (WHERE status IN ('Enviado', 'Pronto para Retirada'))
+        FROM oceano_pedidos
+        WHERE cliente_id = $1"""),
+}
+
+def execute_prepared(cur, nome, params=()):
+    """Executa um prepared statement, criando-o na conexão na primeira vez que for usado."""
+    conn = cur.connection
+    if nome not in conn.prepared_statements:
+        tipos, sql = PREPARED_STATEMENTS[nome]
+        cur.execute(f"PREPARE {nome}({tipos}) AS {sql}" if tipos else f"PREPARE {nome} AS {sql}")
+        conn.prepared_statements.add(nome)
+    if params:
+        cur.execute(f"EXECUTE {nome}({', '.join(['%s'] * len(params))})", params)
+    else:
+        cur.execute(f"EXECUTE {nome}")
+
+def json_default(value):
+    """Converte tipos do banco (datas, horários, decimais) em valores compatíveis com JSON."""
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, datetime.time):
+        return value.strftime('%H:%M')
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    return DefaultJSONProvider.default(value)
+
+# Datas e horários também passam pelo json_default, mantendo o formato que o front já recebe ('%H:%M')
+ORJSON_OPCOES = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+class OceanoJSONProvider(JSONProvider):
+    """Provider JSON do Flask baseado no orjson: o jsonify serializa as linhas do banco em C, direto para bytes."""
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=json_default, option=ORJSON_OPCOES).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj, default=json_default, option=ORJSON_OPCOES),
+                                        mimetype='application/json')
+
+app.json = OceanoJSONProvider(app)
+
+def parse_specs(valor):
+    """Converte as especificações técnicas (texto JSON do admin ou dict) para gravar na coluna JSONB."""
+    if not valor:
+        return None
+    if isinstance(valor, str):
+        try:
+            valor = json.loads(valor)
+        except json.JSONDecodeError:
+            # Texto livre vira uma única especificação, como a página do produto sempre exibiu
+            valor = {"Descrição": valor}
+    return psycopg2.extras.Json(valor)
+
+def parse_galeria(valor):
+    """Converte a galeria enviada pelo admin (lista JSON de URLs) em lista para o text[].
+    Texto com URLs separadas por vírgula continua aceito, para clientes antigos da API."""
+    if isinstance(valor, str):
+        valor = valor.split(',')
+    return [url.strip() for url in valor or [] if url and url.strip()] or None
+
+# Colunas de oceano_produtos editadas pelo admin: o INSERT, o UPDATE e os parâmetros saem desta lista
+PRODUTO_COLUNAS = (
+    'nome_produto', 'codigo_produto', 'whatsapp_link_texto', 'descricao_curta', 'descricao_longa',
+    'especificacoes_tecnicas', 'imagem_principal_url', 'imagem_principal_alt', 'galeria_imagens',
+    'categoria', 'subcategoria', 'url_slug', 'meta_title', 'meta_description',
+)
+# Colunas cujo valor recebido do admin precisa ser convertido antes de gravar
+PRODUTO_CONVERSORES = {'especificacoes_tecnicas': parse_specs, 'galeria_imagens': parse_galeria}
+
+SQL_INSERT_PRODUTO = (f"INSERT INTO oceano_produtos ({', '.join(PRODUTO_COLUNAS)}) "
+                      f"VALUES ({', '.join(['%s'] * len(PRODUTO_COLUNAS))}) RETURNING id;")
+# Importação em lote: execute_values expande o VALUES %s em várias linhas
+SQL_INSERT_PRODUTOS_LOTE = f"INSERT INTO oceano_produtos ({', '.join(PRODUTO_COLUNAS)}) VALUES %s RETURNING id;"
+SQL_UPDATE_PRODUTO = f"UPDATE oceano_produtos SET {', '.join(c + ' = %s' for c in PRODUTO_COLUNAS)} WHERE id = %s;"
+
+def produto_params(data):
+    """Monta os valores das colunas de oceano_produtos, na ordem de PRODUTO_COLUNAS."""
+    valores = []
+    for coluna in PRODUTO_COLUNAS:
+        converter = PRODUTO_CONVERSORES.get(coluna)
+        valores.append(converter(data.get(coluna)) if converter else data.get(coluna))
+    return tuple(valores)
 
 # [NOVO] Função para gerar código de acesso
 def generate_access_code(length=8):
@@ -85,21 +315,58 @@ def generate_access_code(length=8):
     characters = string.ascii_uppercase + string.digits
     return ''.join(random.choice(characters) for i in range(length))
 
+# Hash conferido quando o usuário não existe, para o tempo de resposta não revelar quais usernames são válidos
+_SENHA_ADMIN_FICTICIA = generate_password_hash(generate_access_code(16))
+
+def senha_admin_hasheada(armazenada):
+    """Indica se a chave do admin já está gravada como hash do werkzeug (e não em texto puro)."""
+    return bool(armazenada) and armazenada.startswith(('scrypt:', 'pbkdf2:'))
+
+def senha_admin_confere(armazenada, senha):
+    """Confere a senha do admin, aceitando também as chaves antigas gravadas em texto puro."""
+    # Chave NULL/vazia no banco ou senha em branco nunca conferem
+    if not armazenada or not senha:
+        return False
+    if senha_admin_hasheada(armazenada):
+        return check_password_hash(armazenada, senha)
+    return hmac.compare_digest(armazenada.encode('utf-8'), senha.encode('utf-8'))
+
 # =====================================================================
 # --- DECORADORES DE AUTENTICAÇÃO (Admin e Cliente) ---
 # =====================================================================
 
+def get_bearer_token():
+    """Extrai o token do cabeçalho 'Authorization: Bearer <token>' (None se ausente ou malformado)."""
+    partes = request.headers.get('Authorization', '').split(" ")
+    return partes[1] if len(partes) == 2 and partes[1] else None
+
+# Tokens já validados: o painel admin faz várias chamadas por tela com o mesmo token,
+# então evita refazer o HMAC do JWT a cada requisição. Só tokens válidos entram no cache.
+JWT_CACHE_TTL = int(os.getenv('JWT_CACHE_TTL', 300))
+_jwt_cache = TTLCache(maxsize=1024, ttl=JWT_CACHE_TTL)
+_jwt_cache_lock = threading.Lock()
+
+def decodificar_token(token):
+    """jwt.decode com cache por token; a expiração ('exp') continua sendo conferida a cada uso."""
+    with _jwt_cache_lock:
+        data = _jwt_cache.get(token)
+    if data is None:
+        data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
+        with _jwt_cache_lock:
+            _jwt_cache[token] = data
+    elif data.get('exp') is not None and data['exp'] <= time.time():
+        raise jwt.ExpiredSignatureError("Signature has expired")
+    return data
+
 def admin_token_required(f):
     """Decorador para rotas de ADMIN"""
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = None
-        if 'Authorization' in request.headers:
-            token = request.headers['Authorization'].split(" ")[1]
+        token = get_bearer_token()
         if not token:
             return jsonify({'erro': 'Token de admin está faltando!'}), 401
         try:
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
+            data = decodificar_token(token)
             # Verifica se é um token de admin
             if 'admin_id' not in data:
                 return jsonify({'erro': 'Token inválido (não é admin)!'}), 401
@@ -112,13 +379,11 @@ def cliente_token_required(f):
     """Decorador para rotas de CLIENTE"""
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = None
-        if 'Authorization' in request.headers:
-            token = request.headers['Authorization'].split(" ")[1]
+        token = get_bearer_token()
         if not token:
             return jsonify({'erro': 'Token de cliente está faltando!'}), 401
         try:
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
+            data = decodificar_token(token)
             # Passa o ID do cliente para a rota
             kwargs['cliente_id'] = data['cliente_id']
         except Exception as e:
@@ -131,115 +396,307 @@ def cliente_token_required(f):
 # --- PARTE 1: ROTAS PÚBLICAS (O Site 'oceano-etiquetas') ---
 # =====================================================================
 
+# Cache do menu dinâmico: o menu muda raramente, então evita uma query por template renderizado
+MENU_CACHE_TTL = int(os.getenv('MENU_CACHE_TTL', 300))
+_menu_cache = TTLCache(maxsize=1, ttl=MENU_CACHE_TTL)
+_menu_cache_lock = threading.Lock()
+# Com o banco fora do ar toda página falha no menu: o traceback completo sai no máximo uma vez por minuto
+MENU_ERRO_INTERVALO_LOG = 60
+_menu_erro_ultimo_log = float('-inf')
+
+# Cache do HTML renderizado: slug do produto (ou ('template', nome) das páginas fixas) -> (etag, html)
+PAGE_CACHE_TTL = int(os.getenv('PAGE_CACHE_TTL', 600))
+_page_cache = TTLCache(maxsize=512, ttl=PAGE_CACHE_TTL)
+_page_cache_lock = threading.Lock()
+
+# Cache do JSON completo de /api/produtos: 'catalogo' -> (etag, corpo)
+_api_produtos_cache = TTLCache(maxsize=1, ttl=PAGE_CACHE_TTL)
+_api_produtos_cache_lock = threading.Lock()
+
+def invalidar_caches_catalogo():
+    """Descarta o menu, as páginas, o catálogo JSON e as respostas do chatbot em cache após uma alteração no catálogo."""
+    # Vale só para este worker; nos demais o TTL cuida da expiração
+    with _menu_cache_lock:
+        _menu_cache.clear()
+    with _page_cache_lock:
+        _page_cache.clear()
+    with _api_produtos_cache_lock:
+        _api_produtos_cache.clear()
+    # Respostas do chatbot podem citar o catálogo (get_product_list)
+    with _chat_cache_lock:
+        _chat_cache.clear()
+
+# Canal LISTEN/NOTIFY que avisa todos os workers quando o catálogo muda
+CATALOGO_CANAL = 'oceano_catalogo'
+
+def notificar_catalogo_alterado(cur):
+    """Agenda o aviso de alteração do catálogo; o PostgreSQL só o entrega no COMMIT da transação."""
+    cur.execute(f"NOTIFY {CATALOGO_CANAL}")
+
+def ouvir_alteracoes_catalogo():
+    """Thread de cada worker: escuta o canal do catálogo e limpa os caches locais a cada aviso."""
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(DATABASE_URL)
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {CATALOGO_CANAL}")
+            # Descarta o que possa ter mudado enquanto a escuta estava fora do ar
+            invalidar_caches_catalogo()
+            while True:
+                if select.select([conn], [], [], 60) == ([], [], []):
+                    continue
+                conn.poll()
+                if conn.notifies:
+                    conn.notifies.clear()
+                    invalidar_caches_catalogo()
+        except Exception as e:
+            log.warning("Escuta do canal %s interrompida, reconectando: %s", CATALOGO_CANAL, e)
+            if conn is not None:
+                conn.close()
+            time.sleep(5)
+
 @app.context_processor
 def inject_dynamic_menu():
     """Injeta dados do menu em todos os templates renderizados."""
-    conn = None
-    categorias_ordem = ['Lacres', 'Adesivos', 'Brindes', 'Impressos']
-    # --- MUDANÇA 1: O valor de cada categoria agora é um dicionário para subcategorias ---
-    menu_data = collections.OrderedDict([(cat, collections.OrderedDict()) for cat in categorias_ordem])
-    try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        # --- MUDANÇA 2: Adicionado 'subcategoria' à query ---
-        query = """
-            SELECT nome_produto, url_slug, categoria, subcategoria
-            FROM oceano_produtos 
-            WHERE categoria IS NOT NULL AND categoria != '' AND url_slug IS NOT NULL AND url_slug != ''
-            ORDER BY categoria, subcategoria, nome_produto;
-        """
-        cur.execute(query)
-        produtos = cur.fetchall()
-        cur.close()
-        
-        for produto in produtos:
-            cat = produto['categoria']
-            # --- MUDANÇA 3: Pega a subcategoria ---
-            subcat = produto['subcategoria'] if produto['subcategoria'] else 'Outros' # Define 'Outros' se for nulo
-            
-            slug_do_bd = produto['url_slug']
-            if slug_do_bd.startswith('/produtos/'):
-                slug_limpo = slug_do_bd[len('/produtos/'):]
+    # O lock evita que vários requests refaçam a mesma query quando o cache expira
+    with _menu_cache_lock:
+        menu_em_cache = _menu_cache.get('menu')
+        if menu_em_cache is not None:
+            return dict(menu_categorias=menu_em_cache)
+
+        categorias_ordem = ['Lacres', 'Adesivos', 'Brindes', 'Impressos']
+        # --- MUDANÇA 1: O valor de cada categoria agora é um dicionário para subcategorias ---
+        menu_data = collections.OrderedDict([(cat, collections.OrderedDict()) for cat in categorias_ordem])
+        try:
+            with get_db_connection() as conn:
+                # Cursor de tuplas: as colunas são fixas e lidas por posição, sem um dict por linha
+                cur = conn.cursor()
+                # --- MUDANÇA 2: Adicionado 'subcategoria' à query (ver PREPARED_STATEMENTS) ---
+                execute_prepared(cur, 'menu_produtos', (categorias_ordem,))
+                grupos = cur.fetchall()
+                cur.close()
+
+            for categoria, subcategoria, produtos in grupos:
+                # --- MUDANÇA 3: Pega a subcategoria ---
+                subcat = subcategoria or 'Outros' # Define 'Outros' se for nulo
+
+                # --- MUDANÇA 4: Aninha os produtos dentro de subcategorias (criadas na primeira ocorrência) ---
+                menu_data[categoria].setdefault(subcat, []).extend(produtos)
+
+            # --- [CORREÇÃO DO ERRO] ---
+            # A linha que filtrava categorias vazias foi REMOVIDA.
+            # Agora, ele sempre retorna o dicionário completo.
+            _menu_cache['menu'] = menu_data
+            return dict(menu_categorias=menu_data)
+        except Exception as e:
+            # Em caso de erro o menu vazio NÃO é guardado no cache
+            global _menu_erro_ultimo_log
+            agora = time.monotonic()
+            if agora - _menu_erro_ultimo_log >= MENU_ERRO_INTERVALO_LOG:
+                _menu_erro_ultimo_log = agora
+                log.exception("ERRO CRÍTICO ao gerar menu dinâmico: %s", e)
             else:
-                slug_limpo = slug_do_bd
-            url_final_para_link = f"/produtos/{slug_limpo}"
-            produto_data = {'nome': produto['nome_produto'], 'url': url_final_para_link}
-            
-            # --- MUDANÇA 4: Lógica para aninhar produtos dentro de subcategorias ---
-            if cat in menu_data:
-                if subcat not in menu_data[cat]:
-                    menu_data[cat][subcat] = [] # Cria a lista para a nova subcategoria
-                menu_data[cat][subcat].append(produto_data)
-
-        # --- [CORREÇÃO DO ERRO] ---
-        # A linha que filtrava categorias vazias foi REMOVIDA.
-        # Agora, ele sempre retorna o dicionário completo.
-        return dict(menu_categorias=menu_data)
-    except Exception as e:
-        print(f"ERRO CRÍTICO ao gerar menu dinâmico: {e}")
-        traceback.print_exc()
-        return dict(menu_categorias=collections.OrderedDict())
-    finally:
-        if conn: conn.close()
+                log.warning("ERRO ao gerar menu dinâmico (repetido): %s", e)
+            return dict(menu_categorias=collections.OrderedDict())
+
+# --- MUDANÇA 5: Adicionado 'url_slug' à query (ESSA ERA A CAUSA DO ERRO 'undefined') ---
+API_PRODUTOS_COLUNAS = "id, nome_produto, codigo_produto, categoria, subcategoria, imagem_principal_url, descricao_curta, url_slug"
+
+def stream_json_array(query, params=None):
+    """
+    Transmite o resultado de uma query como array JSON, sem carregar todas as linhas na memória.
+    A query deve devolver uma coluna de texto JSON por linha (row_to_json(...)::text).
+    Falhas de conexão/query são levantadas aqui, antes de a resposta começar.
+    """
+    def gerar_json():
+        # A conexão fica emprestada enquanto a resposta é transmitida e volta ao pool ao final
+        with get_db_connection() as conn:
+            # Cursor nomeado (server-side): as linhas chegam em lotes, sem carregar a tabela inteira na memória
+            cur = conn.cursor('stream_json')
+            cur.itersize = 500
+            cur.execute(query, params)
+            yield '['
+            primeiro = True
+            for (linha_json,) in cur:
+                yield ('' if primeiro else ',') + linha_json
+                primeiro = False
+            yield ']'
+            cur.close()
+
+    def transmitir(inicio, restante):
+        yield inicio
+        yield from restante
+
+    stream = gerar_json()
+    # Avança até o '[' para que falhas de conexão/query ainda possam virar um 500 em JSON
+    inicio = next(stream)
+    return Response(transmitir(inicio, stream), mimetype='application/json')
 
 @app.route('/api/produtos')
 def get_api_produtos():
     """Retorna uma lista JSON de todos os produtos (usado pelo Portal do Cliente)."""
-    conn = None
+    # Com ?limit= ou ?after= a resposta é paginada; sem eles continua a lista completa
+    # que o index.html e o portal.html consomem
+    paginacao = ler_paginacao(tamanho_cursor=2)
+    if paginacao:
+        return get_api_produtos_pagina(*paginacao)
+
+    with _api_produtos_cache_lock:
+        catalogo = _api_produtos_cache.get('catalogo')
+
+    if catalogo is None:
+        # json_agg: o PostgreSQL já entrega o array inteiro serializado (::text evita o parse
+        # de volta para lista pelo psycopg2), pronto para ir em cache e na resposta
+        query = f"""
+            SELECT COALESCE(json_agg(p ORDER BY p.nome_produto), '[]')::text
+            FROM (SELECT {API_PRODUTOS_COLUNAS} FROM oceano_produtos) p;
+        """
+        try:
+            with get_db_connection() as conn:
+                cur = conn.cursor()
+                cur.execute(query)
+                corpo = cur.fetchone()[0].encode('utf-8')
+                cur.close()
+        except Exception as e:
+            log.error("ERRO no endpoint /api/produtos: %s", e)
+            return jsonify({'error': 'Erro interno ao buscar produtos.'}), 500
+
+        catalogo = (hashlib.blake2b(corpo, digest_size=16).hexdigest(), corpo)
+        with _api_produtos_cache_lock:
+            _api_produtos_cache['catalogo'] = catalogo
+
+    etag, corpo = catalogo
+    resposta = Response(corpo, mimetype='application/json')
+    resposta.set_etag(etag)
+    resposta.headers['Cache-Control'] = 'public, max-age=60'
+    # Devolve 304 (sem corpo) quando o cliente já tem esta versão do catálogo (If-None-Match)
+    return resposta.make_conditional(request)
+
+def codificar_cursor(valores):
+    """Cursor opaco de paginação: os valores da chave de ordenação da última linha, em JSON base64url (sem '=')."""
+    cursor = base64.urlsafe_b64encode(orjson.dumps(valores, default=json_default, option=ORJSON_OPCOES))
+    return cursor.decode('ascii').rstrip('=')
+
+def ler_paginacao(tamanho_cursor=1):
+    """
+    Lê a paginação keyset da query string (?limit=50&after=<next_cursor>).
+    Retorna (limit, after) ou None quando a rota deve devolver a lista completa; 'after' é a lista
+    com os 'tamanho_cursor' valores da chave de ordenação (None na primeira página).
+    Cursor inválido encerra a requisição com 400, por isso deve ser chamada fora dos try/except das rotas.
+    """
+    if 'limit' not in request.args and 'after' not in request.args:
+        return None
+    limit = max(1, min(request.args.get('limit', 50, type=int), 200))
+    after = request.args.get('after')
+    if after is not None:
+        try:
+            after = orjson.loads(base64.urlsafe_b64decode(after.encode('ascii') + b'=' * (-len(after) % 4)))
+        except (ValueError, UnicodeError):
+            after = None
+        if not isinstance(after, list) or len(after) != tamanho_cursor:
+            abort(make_response(jsonify({'erro': 'Cursor de paginação inválido.'}), 400))
+    return limit, after
+
+def pagina_json(linhas, limit, chaves=('id',)):
+    """Resposta de uma página: as linhas e o cursor a passar em ?after= (None na última página).
+    'chaves' são as colunas da ordenação, na mesma ordem do ORDER BY."""
+    next_cursor = codificar_cursor([linhas[-1][c] for c in chaves]) if len(linhas) == limit else None
+    return jsonify({'data': linhas, 'next_cursor': next_cursor})
+
+def get_api_produtos_pagina(limit, after):
+    """
+    Retorna uma página de produtos com paginação keyset.
+    O cursor traz (nome_produto, id) do último produto da página anterior, que é também a ordem:
+    comparar com esses valores (e não reler o produto) mantém a paginação certa mesmo se ele
+    for renomeado ou excluído entre as páginas.
+    """
+    query = f"SELECT {API_PRODUTOS_COLUNAS} FROM oceano_produtos"
+    params = []
+    if after is not None:
+        nome, ultimo_id = after
+        if nome is None:
+            # Produtos sem nome vêm por último (NULLS LAST do ASC): só resta desempatar pelo id
+            query += " WHERE nome_produto IS NULL AND id > %s"
+            params.append(ultimo_id)
+        else:
+            query += " WHERE ((nome_produto, id) > (%s, %s) OR nome_produto IS NULL)"
+            params += [nome, ultimo_id]
+    query += " ORDER BY nome_produto, id LIMIT %s;"
+    params.append(limit)
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        # --- MUDANÇA 5: Adicionado 'url_slug' à query (ESSA ERA A CAUSA DO ERRO 'undefined') ---
-        query = "SELECT id, nome_produto, codigo_produto, categoria, subcategoria, imagem_principal_url, descricao_curta, url_slug FROM oceano_produtos ORDER BY nome_produto;"
-        cur.execute(query)
-        produtos_raw = cur.fetchall()
-        cur.close()
-        produtos_processados = [format_db_data(dict(produto)) for produto in produtos_raw]
-        return jsonify(produtos_processados)
+        with get_db_connection() as conn:
+            cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            cur.execute(query, params)
+            produtos = cur.fetchall()
+            cur.close()
+        return pagina_json(produtos, limit, chaves=('nome_produto', 'id'))
     except Exception as e:
-        print(f"ERRO no endpoint /api/produtos: {e}")
+        log.error("ERRO no endpoint /api/produtos (paginado): %s", e)
         return jsonify({'error': 'Erro interno ao buscar produtos.'}), 500
-    finally:
-        if conn: conn.close()
 
 @app.route('/produtos/<path:slug>') 
 def produto_detalhe(slug):
-    """Renderiza a página de detalhe de um produto."""
-    conn = None
-    try: 
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        url_busca_com_prefixo = f"/produtos/{slug}"
-        cur.execute('SELECT * FROM oceano_produtos WHERE url_slug = %s;', (url_busca_com_prefixo,))
-        produto = cur.fetchone()
-        if not produto:
-            print(f"AVISO: Buscando slug legado por '{slug}'.")
-            cur.execute('SELECT * FROM oceano_produtos WHERE url_slug = %s;', (slug,))
-            produto = cur.fetchone()
-        cur.close()
-        if produto:
-            produto_formatado = format_db_data(dict(produto))
-            specs_json_string = produto_formatado.get('especificacoes_tecnicas')
-            specs_dict = {} 
-            if specs_json_string:
-                try:
-                    specs_dict = json.loads(specs_json_string)
-                except json.JSONDecodeError:
-                    specs_dict = {"Descrição": specs_json_string}
-            produto_formatado['specs'] = specs_dict
-            return render_template('oceano-produto-detalhe.html', produto=produto_formatado)
-        else:
-            return "Produto não encontrado", 404
-    except Exception as e:
-        print(f"ERRO na rota /produtos/{slug}: {e}")
-        return "Erro ao carregar a página do produto", 500
-    finally:
-        if conn: conn.close()
+    """Renderiza a página de detalhe de um produto (o HTML fica em cache por slug)."""
+    with _page_cache_lock:
+        pagina = _page_cache.get(slug)
+
+    if pagina is None:
+        try: 
+            with get_db_connection() as conn:
+                cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+                # Busca o slug com prefixo e o slug legado (sem prefixo) na mesma ida ao banco
+                execute_prepared(cur, 'produto_by_slug', ([f"/produtos/{slug}", slug],))
+                produto = cur.fetchone()
+                cur.close()
+            if not produto:
+                return "Produto não encontrado", 404
+            # A coluna é JSONB: o psycopg2 já entrega as especificações como dict
+            produto['specs'] = produto.get('especificacoes_tecnicas') or {}
+            html = render_template('oceano-produto-detalhe.html', produto=produto).encode('utf-8')
+        except Exception as e:
+            log.error("ERRO na rota /produtos/%s: %s", slug, e)
+            return "Erro ao carregar a página do produto", 500
+
+        pagina = guardar_pagina(slug, html)
+
+    return resposta_html(pagina)
+
+def guardar_pagina(chave, html):
+    """Monta (etag, html) e guarda no cache de páginas, exceto se o menu dinâmico falhou nesta renderização."""
+    pagina = (hashlib.blake2b(html, digest_size=16).hexdigest(), html)
+    # Se o menu falhou (banco fora do ar), a página sai com o menu vazio e não vai para o cache
+    with _menu_cache_lock:
+        menu_ok = 'menu' in _menu_cache
+    if menu_ok:
+        with _page_cache_lock:
+            _page_cache[chave] = pagina
+    return pagina
+
+def resposta_html(pagina, cache_control='public, max-age=300'):
+    """Monta a resposta de uma página em cache (etag, html)."""
+    etag, html = pagina
+    resposta = Response(html, mimetype='text/html')
+    resposta.set_etag(etag)
+    resposta.headers['Cache-Control'] = cache_control
+    # Devolve 304 (sem corpo) quando o navegador já tem esta versão (If-None-Match)
+    return resposta.make_conditional(request)
+
+def render_template_cacheado(nome, cache_control='public, max-age=300'):
+    """Renderiza um template sem dados por requisição uma única vez e reaproveita o HTML até o TTL
+    ou uma alteração no catálogo (o menu dinâmico faz parte da página)."""
+    chave = ('template', nome)
+    with _page_cache_lock:
+        pagina = _page_cache.get(chave)
+    if pagina is None:
+        pagina = guardar_pagina(chave, render_template(nome).encode('utf-8'))
+    return resposta_html(pagina, cache_control)
 
 @app.route('/')
 def index_route():
     """Renderiza o 'index.html' dinamicamente."""
-    return render_template('index.html')
+    return render_template_cacheado('index.html')
 
 
 # =====================================================================
@@ -249,419 +706,442 @@ def index_route():
 @app.route('/admin')
 def admin_panel_route():
     """Serve a página HTML do painel de administração."""
-    return render_template('admin.html')
+    # 'no-cache': o navegador sempre revalida pelo ETag, então um deploy novo aparece na hora
+    return render_template_cacheado('admin.html', 'no-cache')
 
 @app.route('/api/oceano/admin/login', methods=['POST'])
 def admin_login():
     """Verifica o login do admin na tabela 'oceano_admin'."""
     data = request.get_json()
     username = data.get('username')
-    password = data.get('password')
-    conn = None
+    password = data.get('password') or ''
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cur.execute("SELECT * FROM oceano_admin WHERE username = %s", (username,))
-        admin_user = cur.fetchone()
-        cur.close()
-        if admin_user and admin_user['chave_admin'] == password:
-            token = jwt.encode({
-                'admin_id': admin_user['id'],
-                'username': admin_user['username'],
-                'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24)
-            }, app.config['SECRET_KEY'], algorithm="HS256")
-            return jsonify({'mensagem': 'Login bem-sucedido!', 'token': token})
-        else:
-            return jsonify({'erro': 'Credenciais inválidas. Verifique usuário e senha.'}), 401
+        with get_db_connection() as conn:
+            cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            execute_prepared(cur, 'admin_by_username', (username,))
+            admin_user = cur.fetchone()
+            if admin_user is None:
+                check_password_hash(_SENHA_ADMIN_FICTICIA, password)
+                senha_ok = False
+            else:
+                senha_ok = senha_admin_confere(admin_user['chave_admin'], password)
+            if senha_ok and not senha_admin_hasheada(admin_user['chave_admin']):
+                # Conta antiga em texto puro: grava o hash no primeiro login bem-sucedido
+                cur.execute("UPDATE oceano_admin SET chave_admin = %s WHERE id = %s",
+                            (generate_password_hash(password), admin_user['id']))
+                conn.commit()
+            cur.close()
+            if senha_ok:
+                token = jwt.encode({
+                    'admin_id': admin_user['id'],
+                    'username': admin_user['username'],
+                    'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24)
+                }, app.config['SECRET_KEY'], algorithm="HS256")
+                return jsonify({'mensagem': 'Login bem-sucedido!', 'token': token})
+            else:
+                return jsonify({'erro': 'Credenciais inválidas. Verifique usuário e senha.'}), 401
     except Exception as e:
-        print(f"ERRO no login admin: {e}")
+        log.error("ERRO no login admin: %s", e)
         return jsonify({'erro': 'Erro interno no servidor.'}), 500
-    finally:
-        if conn: conn.close()
 
 @app.route('/api/oceano/admin/dashboard_stats', methods=['GET'])
 @admin_token_required
 def get_dashboard_stats():
     """Coleta estatísticas para os cards do admin."""
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT COUNT(id) FROM oceano_orcamentos WHERE status = 'Aguardando Orçamento'")
-        stat_orcamentos = cur.fetchone()[0]
-        cur.execute("SELECT COUNT(id) FROM oceano_pedidos WHERE status = 'Em Produção'")
-        stat_pedidos = cur.fetchone()[0]
-        cur.execute("SELECT COUNT(id) FROM oceano_produtos")
-        stat_produtos = cur.fetchone()[0]
-        cur.close()
-        return jsonify({
-            'stat_orcamentos': stat_orcamentos,
-            'stat_pedidos': stat_pedidos,
-            'stat_produtos': stat_produtos,
-            # stat_clientes não existe no admin V3, foi removido do dashboard
-        })
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+            # Os três contadores em uma única ida ao banco
+            cur.execute("""
+                SELECT
+                    (SELECT COUNT(id) FROM oceano_orcamentos WHERE status = 'Aguardando Orçamento'),
+                    (SELECT COUNT(id) FROM oceano_pedidos WHERE status = 'Em Produção'),
+                    (SELECT COUNT(id) FROM oceano_produtos);
+            """)
+            stat_orcamentos, stat_pedidos, stat_produtos = cur.fetchone()
+            cur.close()
+            return jsonify({
+                'stat_orcamentos': stat_orcamentos,
+                'stat_pedidos': stat_pedidos,
+                'stat_produtos': stat_produtos,
+                # stat_clientes não existe no admin V3, foi removido do dashboard
+            })
     except Exception as e:
-        print(f"ERRO ao buscar stats: {e}")
+        log.error("ERRO ao buscar stats: %s", e)
         return jsonify({'erro': str(e)}), 500
-    finally:
-        if conn: conn.close()
 
 # --- [CRUD PRODUTOS (Admin)] ---
 @app.route('/api/oceano/admin/produtos', methods=['GET', 'POST'])
 @admin_token_required
 def handle_produtos():
-    conn = None
+    query = "SELECT id, nome_produto, codigo_produto, categoria, imagem_principal_url FROM oceano_produtos"
+    paginacao = ler_paginacao() if request.method == 'GET' else None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        if request.method == 'GET':
-            cur.execute("SELECT id, nome_produto, codigo_produto, categoria, imagem_principal_url FROM oceano_produtos ORDER BY id DESC")
-            produtos = [format_db_data(dict(p)) for p in cur.fetchall()]
-            cur.close()
-            return jsonify(produtos)
-        if request.method == 'POST':
-            data = request.get_json()
-            # [CORREÇÃO] Garante que 'galeria_raw' seja uma string antes de 'split'
-            galeria_raw = data.get('galeria_imagens') or ''
-            galeria_list = [url.strip() for url in galeria_raw.split(',') if url.strip()] or None
-            sql = """
-            INSERT INTO oceano_produtos (
-                nome_produto, codigo_produto, whatsapp_link_texto, descricao_curta, 
-                descricao_longa, especificacoes_tecnicas, imagem_principal_url, 
-                imagem_principal_alt, galeria_imagens, categoria, subcategoria, 
-                url_slug, meta_title, meta_description
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id;
-            """
-            cur.execute(sql, (
-                data.get('nome_produto'), data.get('codigo_produto'), data.get('whatsapp_link_texto'),
-                data.get('descricao_curta'), data.get('descricao_longa'), data.get('especificacoes_tecnicas'),
-                data.get('imagem_principal_url'), data.get('imagem_principal_alt'), galeria_list,
-                data.get('categoria'), data.get('subcategoria'), data.get('url_slug'),
-                data.get('meta_title'), data.get('meta_description')
-            ))
-            novo_id = cur.fetchone()['id']
+        if request.method == 'GET' and not paginacao:
+            # Lista completa transmitida em lotes (cursor nomeado), já serializada pelo PostgreSQL
+            return stream_json_array(f"SELECT row_to_json(p)::text FROM ({query}) p ORDER BY p.id DESC;")
+        with get_db_connection() as conn:
+            cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            if request.method == 'GET':
+                # Paginado (?limit=&after=): mais recentes primeiro, continuando abaixo do último id recebido
+                limit, after = paginacao
+                if after is not None:
+                    cur.execute(query + " WHERE id < %s ORDER BY id DESC LIMIT %s", (after[0], limit))
+                else:
+                    cur.execute(query + " ORDER BY id DESC LIMIT %s", (limit,))
+                produtos = cur.fetchall()
+                cur.close()
+                return pagina_json(produtos, limit)
+            if request.method == 'POST':
+                data = request.get_json()
+                cur.execute(SQL_INSERT_PRODUTO, produto_params(data))
+                novo_id = cur.fetchone()['id']
+                notificar_catalogo_alterado(cur)
+                conn.commit()
+                cur.close()
+                invalidar_caches_catalogo()
+                return jsonify({'mensagem': f'Produto ID {novo_id} criado com sucesso!', 'id': novo_id}), 201
+    except Exception as e:
+        return jsonify({'erro': str(e)}), 500
+
+@app.route('/api/oceano/admin/produtos/bulk', methods=['POST'])
+@admin_token_required
+def post_produtos_bulk():
+    """Cria vários produtos de uma vez (importação): recebe uma lista JSON no mesmo formato do POST."""
+    produtos = request.get_json()
+    if not isinstance(produtos, list) or not produtos or not all(isinstance(p, dict) for p in produtos):
+        return jsonify({'erro': 'Envie uma lista de produtos.'}), 400
+    try:
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+            # Um INSERT de várias linhas a cada 500 produtos, em vez de um INSERT por produto
+            linhas = psycopg2.extras.execute_values(cur, SQL_INSERT_PRODUTOS_LOTE,
+                                                    [produto_params(p) for p in produtos],
+                                                    page_size=500, fetch=True)
+            notificar_catalogo_alterado(cur)
             conn.commit()
             cur.close()
-            return jsonify({'mensagem': f'Produto ID {novo_id} criado com sucesso!', 'id': novo_id}), 201
+            invalidar_caches_catalogo()
+            novos_ids = [linha[0] for linha in linhas]
+            return jsonify({'mensagem': f'{len(novos_ids)} produtos criados com sucesso!', 'ids': novos_ids}), 201
     except Exception as e:
-        if conn: conn.rollback()
         return jsonify({'erro': str(e)}), 500
-    finally:
-        if conn: conn.close()
 
 @app.route('/api/oceano/admin/produtos/<int:id>', methods=['GET', 'PUT', 'DELETE'])
 @admin_token_required
 def handle_produto_id(id):
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        if request.method == 'GET':
-            cur.execute("SELECT * FROM oceano_produtos WHERE id = %s", (id,))
-            produto = cur.fetchone()
-            if not produto: return jsonify({'erro': 'Produto não encontrado'}), 404
-            cur.close()
-            return jsonify(format_db_data(dict(produto)))
-        if request.method == 'PUT':
-            data = request.get_json()
-            # [CORREÇÃO] Garante que 'galeria_raw' seja uma string antes de 'split'
-            galeria_raw = data.get('galeria_imagens') or ''
-            galeria_list = [url.strip() for url in galeria_raw.split(',') if url.strip()] or None
-            sql = """
-            UPDATE oceano_produtos SET
-                nome_produto = %s, codigo_produto = %s, whatsapp_link_texto = %s, 
-                descricao_curta = %s, descricao_longa = %s, especificacoes_tecnicas = %s, 
-                imagem_principal_url = %s, imagem_principal_alt = %s, galeria_imagens = %s, 
-                categoria = %s, subcategoria = %s, url_slug = %s, 
-                meta_title = %s, meta_description = %s
-            WHERE id = %s;
-            """
-            cur.execute(sql, (
-                data.get('nome_produto'), data.get('codigo_produto'), data.get('whatsapp_link_texto'),
-                data.get('descricao_curta'), data.get('descricao_longa'), data.get('especificacoes_tecnicas'),
-                data.get('imagem_principal_url'), data.get('imagem_principal_alt'), galeria_list,
-                data.get('categoria'), data.get('subcategoria'), data.get('url_slug'),
-                data.get('meta_title'), data.get('meta_description'), id
-            ))
-            conn.commit()
-            cur.close()
-            return jsonify({'mensagem': f'Produto ID {id} atualizado com sucesso!'})
-        if request.method == 'DELETE':
-            cur.execute("DELETE FROM oceano_produtos WHERE id = %s", (id,))
-            conn.commit()
-            cur.close()
-            return jsonify({'mensagem': f'Produto ID {id} excluído com sucesso!'})
+        with get_db_connection() as conn:
+            cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            if request.method == 'GET':
+                # Só as colunas que o formulário do admin edita
+                cur.execute(f"SELECT id, {', '.join(PRODUTO_COLUNAS)} FROM oceano_produtos WHERE id = %s", (id,))
+                produto = cur.fetchone()
+                if not produto: return jsonify({'erro': 'Produto não encontrado'}), 404
+                cur.close()
+                return jsonify(produto)
+            if request.method == 'PUT':
+                data = request.get_json()
+                cur.execute(SQL_UPDATE_PRODUTO, produto_params(data) + (id,))
+                notificar_catalogo_alterado(cur)
+                conn.commit()
+                cur.close()
+                invalidar_caches_catalogo()
+                return jsonify({'mensagem': f'Produto ID {id} atualizado com sucesso!'})
+            if request.method == 'DELETE':
+                cur.execute("DELETE FROM oceano_produtos WHERE id = %s", (id,))
+                notificar_catalogo_alterado(cur)
+                conn.commit()
+                cur.close()
+                invalidar_caches_catalogo()
+                return jsonify({'mensagem': f'Produto ID {id} excluído com sucesso!'})
     except Exception as e:
-        if conn: conn.rollback()
         return jsonify({'erro': str(e)}), 500
-    finally:
-        if conn: conn.close()
 
 # --- [CRUD CLIENTES (Admin)] ---
 @app.route('/api/oceano/admin/clientes', methods=['GET', 'POST'])
 @admin_token_required
 def handle_clientes():
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        if request.method == 'GET':
-            cur.execute("SELECT * FROM oceano_clientes ORDER BY nome_cliente")
-            clientes = [format_db_data(dict(c)) for c in cur.fetchall()]
-            cur.close()
-            return jsonify(clientes)
-        if request.method == 'POST':
-            data = request.get_json()
-            sql = "INSERT INTO oceano_clientes (nome_cliente, email, telefone, cnpj_cpf, codigo_acesso) VALUES (%s, %s, %s, %s, %s) RETURNING id;"
-            cur.execute(sql, (data.get('nome_cliente'), data.get('email'), data.get('telefone'), data.get('cnpj_cpf'), data.get('codigo_acesso')))
-            novo_id = cur.fetchone()['id']
-            conn.commit()
-            cur.close()
-            return jsonify({'mensagem': 'Cliente criado com sucesso!', 'id': novo_id}), 201
+        with get_db_connection() as conn:
+            cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            if request.method == 'GET':
+                cur.execute("SELECT id, nome_cliente, email, telefone, cnpj_cpf, codigo_acesso FROM oceano_clientes ORDER BY nome_cliente")
+                clientes = cur.fetchall()
+                cur.close()
+                return jsonify(clientes)
+            if request.method == 'POST':
+                data = request.get_json()
+                sql = "INSERT INTO oceano_clientes (nome_cliente, email, telefone, cnpj_cpf, codigo_acesso) VALUES (%s, %s, %s, %s, %s) RETURNING id;"
+                cur.execute(sql, (data.get('nome_cliente'), data.get('email'), data.get('telefone'), data.get('cnpj_cpf'), data.get('codigo_acesso')))
+                novo_id = cur.fetchone()['id']
+                conn.commit()
+                cur.close()
+                return jsonify({'mensagem': 'Cliente criado com sucesso!', 'id': novo_id}), 201
     except psycopg2.IntegrityError as e:
-        if conn: conn.rollback()
         return jsonify({'erro': f'Erro de integridade: {e.pgerror}'}), 409
     except Exception as e:
-        if conn: conn.rollback()
         return jsonify({'erro': str(e)}), 500
-    finally:
-        if conn: conn.close()
 
 @app.route('/api/oceano/admin/clientes/<int:id>', methods=['DELETE'])
 @admin_token_required
 def handle_cliente_id(id):
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("DELETE FROM oceano_clientes WHERE id = %s", (id,))
-        conn.commit()
-        cur.close()
-        return jsonify({'mensagem': f'Cliente ID {id} excluído com sucesso!'})
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("DELETE FROM oceano_clientes WHERE id = %s", (id,))
+            conn.commit()
+            cur.close()
+            return jsonify({'mensagem': f'Cliente ID {id} excluído com sucesso!'})
     except psycopg2.Error as e:
-        if conn: conn.rollback()
         if e.pgcode == '23503': 
             return jsonify({'erro': 'Não é possível excluir: este cliente já possui orçamentos ou pedidos registrados.'}), 409
         return jsonify({'erro': f'Erro de DB: {e.pgerror}'}), 500
     except Exception as e:
-        if conn: conn.rollback()
         return jsonify({'erro': str(e)}), 500
-    finally:
-        if conn: conn.close()
 
 # --- [CRUD ADMINS (Admin)] ---
 @app.route('/api/oceano/admin/users', methods=['GET', 'POST'])
 @admin_token_required
 def handle_admins():
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        if request.method == 'GET':
-            cur.execute("SELECT id, username, data_criacao FROM oceano_admin ORDER BY id")
-            admins = [format_db_data(dict(a)) for a in cur.fetchall()]
-            cur.close()
-            return jsonify(admins)
-        if request.method == 'POST':
-            data = request.get_json()
-            sql = "INSERT INTO oceano_admin (username, chave_admin) VALUES (%s, %s) RETURNING id;"
-            cur.execute(sql, (data.get('username'), data.get('chave_admin')))
-            novo_id = cur.fetchone()['id']
-            conn.commit()
-            cur.close()
-            return jsonify({'mensagem': 'Admin criado com sucesso!', 'id': novo_id}), 201
+        with get_db_connection() as conn:
+            cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            if request.method == 'GET':
+                cur.execute("SELECT id, username, data_criacao FROM oceano_admin ORDER BY id")
+                admins = cur.fetchall()
+                cur.close()
+                return jsonify(admins)
+            if request.method == 'POST':
+                data = request.get_json()
+                chave_admin = data.get('chave_admin')
+                if not chave_admin or not chave_admin.strip():
+                    return jsonify({'erro': 'A senha (chave_admin) é obrigatória.'}), 400
+                sql = "INSERT INTO oceano_admin (username, chave_admin) VALUES (%s, %s) RETURNING id;"
+                cur.execute(sql, (data.get('username'), generate_password_hash(chave_admin)))
+                novo_id = cur.fetchone()['id']
+                conn.commit()
+                cur.close()
+                return jsonify({'mensagem': 'Admin criado com sucesso!', 'id': novo_id}), 201
     except psycopg2.IntegrityError:
-        if conn: conn.rollback()
         return jsonify({'erro': 'Este nome de usuário já existe.'}), 409
     except Exception as e:
-        if conn: conn.rollback()
         return jsonify({'erro': str(e)}), 500
-    finally:
-        if conn: conn.close()
 
 @app.route('/api/oceano/admin/users/<int:id>', methods=['DELETE'])
 @admin_token_required
 def handle_admin_id(id):
     if id == 1:
         return jsonify({'erro': 'Não é possível excluir o administrador root (ID 1).'}), 403
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("DELETE FROM oceano_admin WHERE id = %s", (id,))
-        conn.commit()
-        cur.close()
-        return jsonify({'mensagem': f'Admin ID {id} excluído com sucesso!'})
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("DELETE FROM oceano_admin WHERE id = %s", (id,))
+            conn.commit()
+            cur.close()
+            return jsonify({'mensagem': f'Admin ID {id} excluído com sucesso!'})
     except Exception as e:
-        if conn: conn.rollback()
         return jsonify({'erro': str(e)}), 500
-    finally:
-        if conn: conn.close()
 
 # --- [API ORÇAMENTOS (Admin)] ---
 @app.route('/api/oceano/admin/orcamentos', methods=['GET'])
 @admin_token_required
 def get_orcamentos():
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        sql = """
-        SELECT o.*, c.nome_cliente 
-        FROM oceano_orcamentos o LEFT JOIN oceano_clientes c ON o.cliente_id = c.id
-        WHERE o.status NOT IN ('Convertido em Pedido', 'Cancelado')
-        ORDER BY o.data_atualizacao DESC;
-        """
-        cur.execute(sql)
-        orcamentos = [format_db_data(dict(o)) for o in cur.fetchall()]
-        cur.close()
-        return jsonify(orcamentos)
+        with get_db_connection() as conn:
+            cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            sql = """
+            SELECT o.id, o.cliente_id, o.status, o.valor_final_total, o.data_criacao, o.data_atualizacao, c.nome_cliente
+            FROM oceano_orcamentos o LEFT JOIN oceano_clientes c ON o.cliente_id = c.id
+            WHERE o.status NOT IN ('Convertido em Pedido', 'Cancelado')
+            ORDER BY o.data_atualizacao DESC;
+            """
+            cur.execute(sql)
+            orcamentos = cur.fetchall()
+            cur.close()
+            return jsonify(orcamentos)
     except Exception as e:
         return jsonify({'erro': str(e)}), 500
-    finally:
-        if conn: conn.close()
 
 @app.route('/api/oceano/admin/orcamentos/<int:id>', methods=['GET', 'PUT'])
 @admin_token_required
 def handle_orcamento_id(id):
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        if request.method == 'GET':
-            orcamento = {}
-            sql_orc = "SELECT o.*, c.nome_cliente, c.email FROM oceano_orcamentos o LEFT JOIN oceano_clientes c ON o.cliente_id = c.id WHERE o.id = %s;"
-            cur.execute(sql_orc, (id,))
-            orcamento_data = cur.fetchone()
-            if not orcamento_data:
-                return jsonify({'erro': 'Orçamento não encontrado'}), 404
-            orcamento = format_db_data(dict(orcamento_data))
-            
-            # [CORREÇÃO 1/7] Corrigido o typo de 'ilens' para 'itens'
-            sql_itens = "SELECT oi.*, p.nome_produto, p.codigo_produto FROM oceano_orcamento_itens oi LEFT JOIN oceano_produtos p ON oi.produto_id = p.id WHERE oi.orcamento_id = %s ORDER BY oi.id;"
-            
-            cur.execute(sql_itens, (id,))
-            itens_data = cur.fetchall()
-            orcamento['itens'] = [format_db_data(dict(i)) for i in itens_data]
-            cur.close()
-            return jsonify(orcamento)
-        if request.method == 'PUT':
-            data = request.get_json()
-            itens_atualizados = data.get('itens', [])
-            cur.execute("BEGIN;")
-            sql_update_orc = """
-            UPDATE oceano_orcamentos SET
-                status = %s, valor_frete = %s, valor_final_total = %s,
-                chave_pix = %s, observacoes_admin = %s, data_atualizacao = CURRENT_TIMESTAMP
-            WHERE id = %s;
-            """
-            cur.execute(sql_update_orc, (data.get('status'), data.get('valor_frete'), data.get('valor_final_total'), data.get('chave_pix'), data.get('observacoes_admin'), id))
-            
-            # [CORREÇÃO 2/7] Corrigido o typo de 'ilens' para 'itens'
-            sql_update_item = "UPDATE oceano_orcamento_itens SET preco_unitario_definido = %s WHERE id = %s AND orcamento_id = %s"
+        with get_db_connection() as conn:
+            # RealDictRow já é um dict: vai direto para o jsonify, sem cópia
+            cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            if request.method == 'GET':
+                # [CORREÇÃO 1/7] Corrigido o typo de 'ilens' para 'itens'
+                # Orçamento e itens na mesma ida ao banco: os itens chegam já agregados em JSON
+                sql_orc = """
+                    SELECT o.id, o.cliente_id, o.status, o.valor_frete, o.valor_final_total, o.chave_pix,
+                           o.observacoes_admin, o.data_criacao, o.data_atualizacao, c.nome_cliente, c.email,
+                           COALESCE((
+                               SELECT json_agg(json_build_object(
+                                          'id', oi.id, 'produto_id', oi.produto_id,
+                                          'quantidade_solicitada', oi.quantidade_solicitada,
+                                          'observacoes_cliente', oi.observacoes_cliente,
+                                          'preco_unitario_definido', oi.preco_unitario_definido,
+                                          'nome_produto', p.nome_produto, 'codigo_produto', p.codigo_produto
+                                      ) ORDER BY oi.id)
+                               FROM oceano_orcamento_itens oi LEFT JOIN oceano_produtos p ON oi.produto_id = p.id
+                               WHERE oi.orcamento_id = o.id
+                           ), '[]'::json) AS itens
+                    FROM oceano_orcamentos o LEFT JOIN oceano_clientes c ON o.cliente_id = c.id
+                    WHERE o.id = %s;
+                """
+                cur.execute(sql_orc, (id,))
+                orcamento = cur.fetchone()
+                cur.close()
+                if not orcamento:
+                    return jsonify({'erro': 'Orçamento não encontrado'}), 404
+                return jsonify(orcamento)
+            if request.method == 'PUT':
+                data = request.get_json()
+                itens_atualizados = data.get('itens', [])
+                cur.execute("BEGIN;")
+                sql_update_orc = """
+                UPDATE oceano_orcamentos SET
+                    status = %s, valor_frete = %s, valor_final_total = %s,
+                    chave_pix = %s, observacoes_admin = %s, data_atualizacao = CURRENT_TIMESTAMP
+                WHERE id = %s;
+                """
+                cur.execute(sql_update_orc, (data.get('status'), data.get('valor_frete'), data.get('valor_final_total'), data.get('chave_pix'), data.get('observacoes_admin'), id))
             
-            for item in itens_atualizados:
-                cur.execute(sql_update_item, (item.get('preco_unitario_definido'), item.get('id'), id))
-            conn.commit()
-            cur.close()
-            return jsonify({'mensagem': 'Orçamento atualizado com sucesso!'})
+                # [CORREÇÃO 2/7] Corrigido o typo de 'ilens' para 'itens'
+                # Um único UPDATE ... FROM (VALUES ...) atualiza o preço de todos os itens de uma vez
+                sql_update_item = """
+                UPDATE oceano_orcamento_itens oi SET preco_unitario_definido = v.preco
+                FROM (VALUES %s) AS v(id, orcamento_id, preco)
+                WHERE oi.id = v.id AND oi.orcamento_id = v.orcamento_id
+                """
+                psycopg2.extras.execute_values(cur, sql_update_item, [
+                    (item.get('id'), id, item.get('preco_unitario_definido')) for item in itens_atualizados
+                ], template="(%s::integer, %s::integer, %s::numeric)", page_size=500)
+                conn.commit()
+                cur.close()
+                return jsonify({'mensagem': 'Orçamento atualizado com sucesso!'})
     except Exception as e:
-        if conn: conn.rollback()
         return jsonify({'erro': str(e)}), 500
-    finally:
-        if conn: conn.close()
 
 @app.route('/api/oceano/admin/orcamentos/<int:id>/aprovar', methods=['POST'])
 @admin_token_required
 def aprovar_orcamento(id):
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cur.execute("BEGIN;")
-        cur.execute("SELECT * FROM oceano_orcamentos WHERE id = %s", (id,))
-        orcamento = cur.fetchone()
-        if not orcamento:
-            return jsonify({'erro': 'Orçamento não encontrado'}), 404
-        
-        # [CORREÇÃO 3/7] Corrigido o typo de 'ilens' para 'itens'
-        cur.execute("SELECT * FROM oceano_orcamento_itens WHERE orcamento_id = %s", (id,))
-        itens_orcamento = cur.fetchall()
-        
-        sql_insert_pedido = "INSERT INTO oceano_pedidos (cliente_id, status, valor_frete, valor_final_total, chave_pix, observacoes_admin, data_criacao, data_atualizacao) VALUES (%s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP) RETURNING id;"
-        cur.execute(sql_insert_pedido, (orcamento['cliente_id'], 'Em Produção', orcamento['valor_frete'], orcamento['valor_final_total'], orcamento['chave_pix'], orcamento['observacoes_admin'], orcamento['data_criacao']))
-        novo_pedido_id = cur.fetchone()['id']
-        
-        # [CORREÇÃO 4/7] Corrigido o erro de lógica. Deve inserir em 'oceano_pedido_itens'
-        sql_insert_item_pedido = "INSERT INTO oceano_pedido_itens (pedido_id, produto_id, quantidade_solicitada, observacoes_cliente, preco_unitario_definido) VALUES (%s, %s, %s, %s, %s);"
-        
-        for item in itens_orcamento:
-            cur.execute(sql_insert_item_pedido, (novo_pedido_id, item['produto_id'], item['quantidade_solicitada'], item['observacoes_cliente'], item['preco_unitario_definido']))
-        
-        cur.execute("UPDATE oceano_orcamentos SET status = 'Convertido em Pedido' WHERE id = %s", (id,))
-        conn.commit()
-        cur.close()
-        return jsonify({'mensagem': f'Orçamento {id} aprovado e convertido no Pedido #{novo_pedido_id}!'})
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+            # Conversão inteira em um único comando (CTEs de escrita, mesma transação):
+            # cria o pedido a partir do orçamento, copia os itens no próprio banco e marca o orçamento
+            # [CORREÇÃO 3/7 e 4/7] Lê de 'oceano_orcamento_itens' e insere em 'oceano_pedido_itens'
+            sql_aprovar = """
+            WITH novo_pedido AS (
+                INSERT INTO oceano_pedidos (cliente_id, status, valor_frete, valor_final_total, chave_pix, observacoes_admin, data_criacao, data_atualizacao)
+                SELECT cliente_id, 'Em Produção', valor_frete, valor_final_total, chave_pix, observacoes_admin, data_criacao, CURRENT_TIMESTAMP
+                FROM oceano_orcamentos WHERE id = %(id)s
+                RETURNING id
+            ), itens AS (
+                INSERT INTO oceano_pedido_itens (pedido_id, produto_id, quantidade_solicitada, observacoes_cliente, preco_unitario_definido)
+                SELECT novo_pedido.id, oi.produto_id, oi.quantidade_solicitada, oi.observacoes_cliente, oi.preco_unitario_definido
+                FROM novo_pedido, oceano_orcamento_itens oi
+                WHERE oi.orcamento_id = %(id)s
+            ), orcamento AS (
+                UPDATE oceano_orcamentos SET status = 'Convertido em Pedido' WHERE id = %(id)s
+            )
+            SELECT id FROM novo_pedido;
+            """
+            cur.execute(sql_aprovar, {'id': id})
+            novo_pedido = cur.fetchone()
+            if not novo_pedido:
+                return jsonify({'erro': 'Orçamento não encontrado'}), 404
+            novo_pedido_id = novo_pedido[0]
+            conn.commit()
+            cur.close()
+            return jsonify({'mensagem': f'Orçamento {id} aprovado e convertido no Pedido #{novo_pedido_id}!'})
     except Exception as e:
-        if conn: conn.rollback()
         return jsonify({'erro': str(e)}), 500
-    finally:
-        if conn: conn.close()
 
 # --- [API PEDIDOS (Admin)] ---
 @app.route('/api/oceano/admin/pedidos', methods=['GET'])
 @admin_token_required
 def get_pedidos():
-    conn = None
+    # Fora do try: um cursor inválido responde 400 (ver ler_paginacao)
+    paginacao = ler_paginacao(tamanho_cursor=2)
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        sql = "SELECT p.*, c.nome_cliente FROM oceano_pedidos p LEFT JOIN oceano_clientes c ON p.cliente_id = c.id ORDER BY p.data_atualizacao DESC;"
-        cur.execute(sql)
-        pedidos = [format_db_data(dict(p)) for p in cur.fetchall()]
-        cur.close()
-        return jsonify(pedidos)
+        with get_db_connection() as conn:
+            cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            sql = ("SELECT p.id, p.cliente_id, p.status, p.valor_final_total, p.data_criacao, p.data_atualizacao, c.nome_cliente "
+                   "FROM oceano_pedidos p LEFT JOIN oceano_clientes c ON p.cliente_id = c.id")
+            if not paginacao:
+                cur.execute(sql + " ORDER BY p.data_atualizacao DESC;")
+                pedidos = cur.fetchall()
+                cur.close()
+                return jsonify(pedidos)
+            # Paginado (?limit=&after=): mesma ordem da lista completa (DESC põe data_atualizacao NULL
+            # primeiro), com o id como desempate. O cursor traz (data_atualizacao, id) do último pedido:
+            # compara com esses valores, então um pedido atualizado ou excluído entre as páginas
+            # não faz a lista recomeçar nem terminar antes da hora
+            limit, after = paginacao
+            params = []
+            if after is not None:
+                data_atualizacao, ultimo_id = after
+                if data_atualizacao is None:
+                    sql += " WHERE ((p.data_atualizacao IS NULL AND p.id < %s) OR p.data_atualizacao IS NOT NULL)"
+                    params.append(ultimo_id)
+                else:
+                    sql += " WHERE (p.data_atualizacao, p.id) < (%s, %s)"
+                    params += [data_atualizacao, ultimo_id]
+            sql += " ORDER BY p.data_atualizacao DESC, p.id DESC LIMIT %s;"
+            params.append(limit)
+            cur.execute(sql, params)
+            pedidos = cur.fetchall()
+            cur.close()
+            return pagina_json(pedidos, limit, chaves=('data_atualizacao', 'id'))
     except Exception as e:
         return jsonify({'erro': str(e)}), 500
-    finally:
-        if conn: conn.close()
 
 @app.route('/api/oceano/admin/pedidos/<int:id>', methods=['GET', 'PUT'])
 @admin_token_required
 def handle_pedido_id(id):
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        if request.method == 'GET':
-            pedido = {}
-            sql_ped = "SELECT p.*, c.nome_cliente, c.email FROM oceano_pedidos p LEFT JOIN oceano_clientes c ON p.cliente_id = c.id WHERE p.id = %s;"
-            cur.execute(sql_ped, (id,))
-            pedido_data = cur.fetchone()
-            if not pedido_data:
-                return jsonify({'erro': 'Pedido não encontrado'}), 404
-            pedido = format_db_data(dict(pedido_data))
-            
-            # [CORREÇÃO 5/7] Corrigido o erro de lógica. Deve ler de 'oceano_pedido_itens'
-            sql_itens = "SELECT pi.*, p.nome_produto, p.codigo_produto FROM oceano_pedido_itens pi LEFT JOIN oceano_produtos p ON pi.produto_id = p.id WHERE pi.pedido_id = %s ORDER BY pi.id;"
-            
-            cur.execute(sql_itens, (id,))
-            itens_data = cur.fetchall()
-            pedido['itens'] = [format_db_data(dict(i)) for i in itens_data]
-            cur.close()
-            return jsonify(pedido)
-        if request.method == 'PUT':
-            data = request.get_json()
-            sql_update_ped = "UPDATE oceano_pedidos SET status = %s, codigo_rastreio = %s, observacoes_admin = %s, data_atualizacao = CURRENT_TIMESTAMP WHERE id = %s;"
-            cur.execute(sql_update_ped, (data.get('status'), data.get('codigo_rastreio'), data.get('observacoes_admin'), id))
-            conn.commit()
-            cur.close()
-            return jsonify({'mensagem': 'Pedido atualizado com sucesso!'})
+        with get_db_connection() as conn:
+            # RealDictRow já é um dict: vai direto para o jsonify, sem cópia
+            cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            if request.method == 'GET':
+                # [CORREÇÃO 5/7] Corrigido o erro de lógica. Deve ler de 'oceano_pedido_itens'
+                # Pedido e itens na mesma ida ao banco: os itens chegam já agregados em JSON
+                sql_ped = """
+                    SELECT p.id, p.cliente_id, p.status, p.valor_frete, p.valor_final_total, p.chave_pix,
+                           p.codigo_rastreio, p.observacoes_admin, p.data_criacao, p.data_atualizacao,
+                           c.nome_cliente, c.email,
+                           COALESCE((
+                               SELECT json_agg(json_build_object(
+                                          'id', pi.id, 'produto_id', pi.produto_id,
+                                          'quantidade_solicitada', pi.quantidade_solicitada,
+                                          'observacoes_cliente', pi.observacoes_cliente,
+                                          'preco_unitario_definido', pi.preco_unitario_definido,
+                                          'nome_produto', pr.nome_produto, 'codigo_produto', pr.codigo_produto
+                                      ) ORDER BY pi.id)
+                               FROM oceano_pedido_itens pi LEFT JOIN oceano_produtos pr ON pi.produto_id = pr.id
+                               WHERE pi.pedido_id = p.id
+                           ), '[]'::json) AS itens
+                    FROM oceano_pedidos p LEFT JOIN oceano_clientes c ON p.cliente_id = c.id
+                    WHERE p.id = %s;
+                """
+                cur.execute(sql_ped, (id,))
+                pedido = cur.fetchone()
+                cur.close()
+                if not pedido:
+                    return jsonify({'erro': 'Pedido não encontrado'}), 404
+                return jsonify(pedido)
+            if request.method == 'PUT':
+                data = request.get_json()
+                sql_update_ped = "UPDATE oceano_pedidos SET status = %s, codigo_rastreio = %s, observacoes_admin = %s, data_atualizacao = CURRENT_TIMESTAMP WHERE id = %s;"
+                cur.execute(sql_update_ped, (data.get('status'), data.get('codigo_rastreio'), data.get('observacoes_admin'), id))
+                conn.commit()
+                cur.close()
+                return jsonify({'mensagem': 'Pedido atualizado com sucesso!'})
     except Exception as e:
-        if conn: conn.rollback()
         return jsonify({'erro': str(e)}), 500
-    finally:
-        if conn: conn.close()
 
 
 # =====================================================================
@@ -671,7 +1151,7 @@ def handle_pedido_id(id):
 @app.route('/portal')
 def cliente_portal_route():
     """Serve a página HTML do portal do cliente."""
-    return render_template('portal.html')
+    return render_template_cacheado('portal.html', 'no-cache')
 
 @app.route('/api/oceano/cliente/login', methods=['POST'])
 def cliente_login():
@@ -681,96 +1161,85 @@ def cliente_login():
     if not codigo_acesso:
         return jsonify({'erro': 'Código de acesso é obrigatório'}), 400
     
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cur.execute("SELECT id, nome_cliente FROM oceano_clientes WHERE codigo_acesso = %s", (codigo_acesso,))
-        cliente = cur.fetchone()
-        cur.close()
+        with get_db_connection() as conn:
+            cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            execute_prepared(cur, 'cliente_by_codigo', (codigo_acesso,))
+            cliente = cur.fetchone()
+            cur.close()
         
-        if cliente:
-            token = jwt.encode({
-                'cliente_id': cliente['id'],
-                'nome_cliente': cliente['nome_cliente'],
-                'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=72) # Token de cliente dura 3 dias
-            }, app.config['SECRET_KEY'], algorithm="HS256")
-            return jsonify({
-                'mensagem': 'Login bem-sucedido!', 
-                'token': token,
-                'cliente_id': cliente['id'],
-                'nome_cliente': cliente['nome_cliente']
-            })
-        else:
-            return jsonify({'erro': 'Código de acesso inválido.'}), 401
+            if cliente:
+                token = jwt.encode({
+                    'cliente_id': cliente['id'],
+                    'nome_cliente': cliente['nome_cliente'],
+                    'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=72) # Token de cliente dura 3 dias
+                }, app.config['SECRET_KEY'], algorithm="HS256")
+                return jsonify({
+                    'mensagem': 'Login bem-sucedido!', 
+                    'token': token,
+                    'cliente_id': cliente['id'],
+                    'nome_cliente': cliente['nome_cliente']
+                })
+            else:
+                return jsonify({'erro': 'Código de acesso inválido.'}), 401
     except Exception as e:
-        print(f"ERRO no login cliente: {e}")
+        log.error("ERRO no login cliente: %s", e)
         return jsonify({'erro': 'Erro interno no servidor.'}), 500
-    finally:
-        if conn: conn.close()
 
 @app.route('/api/oceano/cliente/dashboard', methods=['GET'])
 @cliente_token_required
 def get_cliente_dashboard(cliente_id):
     """Coleta estatísticas para o dashboard do cliente."""
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        # Orçamentos aguardando pagamento
-        cur.execute("SELECT COUNT(id) FROM oceano_orcamentos WHERE cliente_id = %s AND status = 'Aguardando Pagamento'", (cliente_id,))
-        stat_aguardando_pagamento = cur.fetchone()[0]
-        
-        # Pedidos em produção
-        cur.execute("SELECT COUNT(id) FROM oceano_pedidos WHERE cliente_id = %s AND status = 'Em Produção'", (cliente_id,))
-        stat_em_producao = cur.fetchone()[0]
-        
-        # Pedidos enviados/prontos
-        cur.execute("SELECT COUNT(id) FROM oceano_pedidos WHERE cliente_id = %s AND (status = 'Enviado' OR status = 'Pronto para Retirada')", (cliente_id,))
-        stat_prontos = cur.fetchone()[0]
-        
-        cur.close()
-        return jsonify({
-            'stat_aguardando_pagamento': stat_aguardando_pagamento,
-            'stat_em_producao': stat_em_producao,
-            'stat_prontos': stat_prontos
-        })
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+            # Os três contadores em uma única ida ao banco
+            execute_prepared(cur, 'cliente_dashboard', (cliente_id,))
+            stat_aguardando_pagamento, stat_em_producao, stat_prontos = cur.fetchone()
+            cur.close()
+            return jsonify({
+                'stat_aguardando_pagamento': stat_aguardando_pagamento,
+                'stat_em_producao': stat_em_producao,
+                'stat_prontos': stat_prontos
+            })
     except Exception as e:
-        print(f"ERRO ao buscar stats do cliente: {e}")
+        log.error("ERRO ao buscar stats do cliente: %s", e)
         return jsonify({'erro': str(e)}), 500
-    finally:
-        if conn: conn.close()
 
 @app.route('/api/oceano/cliente/orcamentos', methods=['GET'])
 @cliente_token_required
 def get_cliente_orcamentos(cliente_id):
     """Lista TODOS os orçamentos e pedidos de um cliente."""
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        
-        # 1. Pega Orçamentos pendentes
-        sql_orc = "SELECT id, 'orcamento' as tipo, data_criacao, data_atualizacao, status, valor_final_total, chave_pix, NULL as codigo_rastreio, observacoes_admin FROM oceano_orcamentos WHERE cliente_id = %s"
-        
-        # 2. Pega Pedidos aprovados
-        sql_ped = "SELECT id, 'pedido' as tipo, data_criacao, data_atualizacao, status, valor_final_total, chave_pix, codigo_rastreio, observacoes_admin FROM oceano_pedidos WHERE cliente_id = %s"
+        with get_db_connection() as conn:
+            cur = conn.cursor()
         
-        # Une os dois e ordena pela data mais recente
-        sql_union = f"({sql_orc}) UNION ALL ({sql_ped}) ORDER BY data_atualizacao DESC"
+            # 1. Pega Orçamentos pendentes
+            sql_orc = "SELECT id, 'orcamento' as tipo, data_criacao, data_atualizacao, status, valor_final_total, chave_pix, NULL as codigo_rastreio, observacoes_admin FROM oceano_orcamentos WHERE cliente_id = %s"
         
-        cur.execute(sql_union, (cliente_id, cliente_id))
+            # 2. Pega Pedidos aprovados
+            sql_ped = "SELECT id, 'pedido' as tipo, data_criacao, data_atualizacao, status, valor_final_total, chave_pix, codigo_rastreio, observacoes_admin FROM oceano_pedidos WHERE cliente_id = %s"
         
-        documentos = [format_db_data(dict(doc)) for doc in cur.fetchall()]
-        cur.close()
-        return jsonify(documentos)
+            # Une os dois e ordena pela data mais recente
+            sql_union = f"({sql_orc}) UNION ALL ({sql_ped})"
+
+            # O PostgreSQL já devolve o array JSON pronto (texto), que vai direto para a resposta
+            cur.execute(f"SELECT COALESCE(json_agg(t ORDER BY t.data_atualizacao DESC), '[]'::json)::text FROM ({sql_union}) t",
+                        (cliente_id, cliente_id))
+            corpo = cur.fetchone()[0]
+            cur.close()
+            return Response(corpo, mimetype='application/json')
         
     except Exception as e:
-        print(f"ERRO ao buscar orçamentos/pedidos do cliente: {e}")
+        log.error("ERRO ao buscar orçamentos/pedidos do cliente: %s", e)
         return jsonify({'erro': str(e)}), 500
-    finally:
-        if conn: conn.close()
+
+def inserir_itens_orcamento(cur, orcamento_id, itens):
+    """Insere os itens de um orçamento com um único INSERT de várias linhas (execute_values)."""
+    sql_item = "INSERT INTO oceano_orcamento_itens (orcamento_id, produto_id, quantidade_solicitada, observacoes_cliente) VALUES %s;"
+    psycopg2.extras.execute_values(cur, sql_item, [
+        (orcamento_id, item.get('produto_id'), item.get('quantidade'), item.get('observacao')) for item in itens
+    ], page_size=500)
 
 @app.route('/api/oceano/cliente/orcamentos/novo', methods=['POST'])
 @cliente_token_required
@@ -781,38 +1250,27 @@ def post_novo_orcamento(cliente_id):
     if not itens or not isinstance(itens, list) or len(itens) == 0:
         return jsonify({'erro': 'O orçamento deve ter pelo menos um item.'}), 400
         
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cur.execute("BEGIN;")
+        with get_db_connection() as conn:
+            cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            cur.execute("BEGIN;")
         
-        # 1. Cria o Orçamento "capa"
-        sql_orc = "INSERT INTO oceano_orcamentos (cliente_id, status, data_criacao, data_atualizacao) VALUES (%s, 'Aguardando Orçamento', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP) RETURNING id;"
-        cur.execute(sql_orc, (cliente_id,))
-        novo_orcamento_id = cur.fetchone()['id']
+            # 1. Cria o Orçamento "capa"
+            sql_orc = "INSERT INTO oceano_orcamentos (cliente_id, status, data_criacao, data_atualizacao) VALUES (%s, 'Aguardando Orçamento', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP) RETURNING id;"
+            cur.execute(sql_orc, (cliente_id,))
+            novo_orcamento_id = cur.fetchone()['id']
         
-        # 2. Insere os Itens
-        # [CORREÇÃO 6/7] Corrigido o typo de 'ilens' para 'itens'
-        sql_item = "INSERT INTO oceano_orcamento_itens (orcamento_id, produto_id, quantidade_solicitada, observacoes_cliente) VALUES (%s, %s, %s, %s);"
-        for item in itens:
-            cur.execute(sql_item, (
-                novo_orcamento_id,
-                item.get('produto_id'),
-                item.get('quantidade'),
-                item.get('observacao')
-            ))
+            # 2. Insere os Itens
+            # [CORREÇÃO 6/7] Corrigido o typo de 'ilens' para 'itens'
+            inserir_itens_orcamento(cur, novo_orcamento_id, itens)
             
-        conn.commit()
-        cur.close()
-        return jsonify({'mensagem': f'Orçamento #{novo_orcamento_id} solicitado com sucesso! Entraremos em contato em breve.', 'orcamento_id': novo_orcamento_id}), 201
+            conn.commit()
+            cur.close()
+            return jsonify({'mensagem': f'Orçamento #{novo_orcamento_id} solicitado com sucesso! Entraremos em contato em breve.', 'orcamento_id': novo_orcamento_id}), 201
         
     except Exception as e:
-        if conn: conn.rollback()
-        print(f"ERRO ao criar novo orçamento: {e}")
+        log.error("ERRO ao criar novo orçamento: %s", e)
         return jsonify({'erro': str(e)}), 500
-    finally:
-        if conn: conn.close()
 
 # =====================================================================
 # --- [NOVO] PARTE 4: API DE ORÇAMENTO PÚBLICO (do index.html) ---
@@ -843,97 +1301,84 @@ def post_orcamento_publico():
     if not email:
         return jsonify({'erro': 'Email é obrigatório.'}), 400
 
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cur.execute("BEGIN;")
+        with get_db_connection() as conn:
+            cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            cur.execute("BEGIN;")
 
-        cliente_id = None
-        is_new_client = False
+            cliente_id = None
+            is_new_client = False
 
-        # --- Lógica de Cliente ---
+            # --- Lógica de Cliente ---
         
-        # 1. Tenta achar pelo CÓDIGO DE ACESSO (se fornecido)
-        if codigo_acesso_opcional:
-            cur.execute("SELECT id FROM oceano_clientes WHERE codigo_acesso = %s", (codigo_acesso_opcional,))
-            cliente_existente = cur.fetchone()
-            if cliente_existente:
-                cliente_id = cliente_existente['id']
-            else:
-                # Se o código estiver errado, mas o email for obrigatório, não podemos prosseguir
-                return jsonify({'erro': 'Código de Acesso inválido. Verifique o código ou deixe em branco para novo cadastro.'}), 401
+            # 1. Tenta achar pelo CÓDIGO DE ACESSO (se fornecido)
+            if codigo_acesso_opcional:
+                cur.execute("SELECT id FROM oceano_clientes WHERE codigo_acesso = %s", (codigo_acesso_opcional,))
+                cliente_existente = cur.fetchone()
+                if cliente_existente:
+                    cliente_id = cliente_existente['id']
+                else:
+                    # Se o código estiver errado, mas o email for obrigatório, não podemos prosseguir
+                    return jsonify({'erro': 'Código de Acesso inválido. Verifique o código ou deixe em branco para novo cadastro.'}), 401
         
-        # 2. Se não achou pelo código, tenta achar pelo EMAIL
-        if cliente_id is None:
-            cur.execute("SELECT id FROM oceano_clientes WHERE email = %s", (email,))
-            cliente_existente = cur.fetchone()
-            if cliente_existente:
-                cliente_id = cliente_existente['id']
-                # Cliente já existe, mas não forneceu o código (ou não sabia)
-                # O orçamento será associado a ele.
-            else:
-                # 3. Se não achou nem pelo código nem pelo email, CRIA NOVO CLIENTE
-                is_new_client = True
-                novo_codigo_acesso = generate_access_code()
+            # 2. Se não achou pelo código, tenta achar pelo EMAIL
+            if cliente_id is None:
+                cur.execute("SELECT id FROM oceano_clientes WHERE email = %s", (email,))
+                cliente_existente = cur.fetchone()
+                if cliente_existente:
+                    cliente_id = cliente_existente['id']
+                    # Cliente já existe, mas não forneceu o código (ou não sabia)
+                    # O orçamento será associado a ele.
+                else:
+                    # 3. Se não achou nem pelo código nem pelo email, CRIA NOVO CLIENTE
+                    is_new_client = True
+                    novo_codigo_acesso = generate_access_code()
                 
-                sql_novo_cliente = """
-                INSERT INTO oceano_clientes (nome_cliente, email, telefone, codigo_acesso)
-                VALUES (%s, %s, %s, %s) RETURNING id;
-                """
-                cur.execute(sql_novo_cliente, (nome, email, whatsapp, novo_codigo_acesso))
-                cliente_id = cur.fetchone()['id']
+                    sql_novo_cliente = """
+                    INSERT INTO oceano_clientes (nome_cliente, email, telefone, codigo_acesso)
+                    VALUES (%s, %s, %s, %s) RETURNING id;
+                    """
+                    cur.execute(sql_novo_cliente, (nome, email, whatsapp, novo_codigo_acesso))
+                    cliente_id = cur.fetchone()['id']
 
-        if cliente_id is None:
-            raise Exception("Falha ao identificar ou criar cliente.")
+            if cliente_id is None:
+                raise Exception("Falha ao identificar ou criar cliente.")
 
-        # --- Lógica de Orçamento (igual à rota do cliente) ---
+            # --- Lógica de Orçamento (igual à rota do cliente) ---
         
-        # 1. Cria o Orçamento "capa"
-        sql_orc = "INSERT INTO oceano_orcamentos (cliente_id, status, data_criacao, data_atualizacao) VALUES (%s, 'Aguardando Orçamento', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP) RETURNING id;"
-        cur.execute(sql_orc, (cliente_id,))
-        novo_orcamento_id = cur.fetchone()['id']
+            # 1. Cria o Orçamento "capa"
+            sql_orc = "INSERT INTO oceano_orcamentos (cliente_id, status, data_criacao, data_atualizacao) VALUES (%s, 'Aguardando Orçamento', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP) RETURNING id;"
+            cur.execute(sql_orc, (cliente_id,))
+            novo_orcamento_id = cur.fetchone()['id']
         
-        # 2. Insere os Itens
-        # [CORREÇÃO 7/7] Corrigido o typo de 'ilens' para 'itens'
-        sql_item = "INSERT INTO oceano_orcamento_itens (orcamento_id, produto_id, quantidade_solicitada, observacoes_cliente) VALUES (%s, %s, %s, %s);"
-        for item in itens:
-            cur.execute(sql_item, (
-                novo_orcamento_id,
-                item.get('produto_id'),
-                item.get('quantidade'),
-                item.get('observacao')
-            ))
+            # 2. Insere os Itens
+            # [CORREÇÃO 7/7] Corrigido o typo de 'ilens' para 'itens'
+            inserir_itens_orcamento(cur, novo_orcamento_id, itens)
             
-        conn.commit()
-        cur.close()
+            conn.commit()
+            cur.close()
         
-        # Retorna a resposta correta
-        if is_new_client:
-            return jsonify({
-                'mensagem': f'Orçamento #{novo_orcamento_id} enviado! Nossa equipe entrará em contato. Um novo cadastro foi criado para você.', 
-                'is_new': True
-            }), 201
-        else:
-             return jsonify({
-                'mensagem': f'Orçamento #{novo_orcamento_id} enviado! Vimos que você já é nosso cliente. Em breve o orçamento aparecerá no seu portal.', 
-                'is_new': False
-            }), 201
+            # Retorna a resposta correta
+            if is_new_client:
+                return jsonify({
+                    'mensagem': f'Orçamento #{novo_orcamento_id} enviado! Nossa equipe entrará em contato. Um novo cadastro foi criado para você.', 
+                    'is_new': True
+                }), 201
+            else:
+                 return jsonify({
+                    'mensagem': f'Orçamento #{novo_orcamento_id} enviado! Vimos que você já é nosso cliente. Em breve o orçamento aparecerá no seu portal.', 
+                    'is_new': False
+                }), 201
         
     except psycopg2.IntegrityError as e:
-        if conn: conn.rollback()
         # Erro comum: email duplicado (se tentou criar cliente que já existia por email)
         if 'oceano_clientes_email_key' in str(e):
              return jsonify({'erro': 'Este email já está cadastrado. Por favor, insira seu Código de Acesso ou use outro email.'}), 409
-        print(f"ERRO de Integridade no orçamento público: {e}")
+        log.error("ERRO de Integridade no orçamento público: %s", e)
         return jsonify({'erro': 'Erro de banco de dados. Verifique os dados.'}), 500
     except Exception as e:
-        if conn: conn.rollback()
-        print(f"ERRO ao criar novo orçamento público: {e}")
-        traceback.print_exc()
+        log.exception("ERRO ao criar novo orçamento público: %s", e)
         return jsonify({'erro': str(e)}), 500
-    finally:
-        if conn: conn.close()
 
 
 # =====================================================================
@@ -943,87 +1388,81 @@ def post_orcamento_publico():
 # --- Ferramentas do Chatbot ---
 def tool_check_status_pedido(pedido_id_str, cliente_id):
     """Ferramenta: Busca o status de um pedido ou orçamento no banco de dados."""
-    print(f"[Chatbot Tool] Verificando Pedido/Orçamento ID {pedido_id_str} para Cliente {cliente_id}")
+    log.info("[Chatbot Tool] Verificando Pedido/Orçamento ID %s para Cliente %s", pedido_id_str, cliente_id)
     try:
         pedido_id = int(pedido_id_str)
     except ValueError:
         return json.dumps({"erro": "ID do pedido inválido. Deve ser um número."})
     
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        with get_db_connection() as conn:
+            cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         
-        # Tenta buscar em Orçamentos primeiro
-        cur.execute("SELECT status, valor_final_total, chave_pix, observacoes_admin FROM oceano_orcamentos WHERE id = %s AND cliente_id = %s", (pedido_id, cliente_id))
-        doc = cur.fetchone()
-        tipo = "Orçamento"
-        
-        # Se não achar, tenta em Pedidos
-        if not doc:
-            cur.execute("SELECT status, valor_final_total, codigo_rastreio, observacoes_admin FROM oceano_pedidos WHERE id = %s AND cliente_id = %s", (pedido_id, cliente_id))
+            # Orçamentos e Pedidos em uma única ida ao banco; se o ID existir nos dois,
+            # o Orçamento tem preferência ('Orçamento' < 'Pedido' no ORDER BY)
+            cur.execute("""
+                SELECT 'Orçamento' AS tipo, status, valor_final_total, chave_pix, NULL AS codigo_rastreio, observacoes_admin
+                FROM oceano_orcamentos WHERE id = %(id)s AND cliente_id = %(cliente_id)s
+                UNION ALL
+                SELECT 'Pedido', status, valor_final_total, NULL, codigo_rastreio, observacoes_admin
+                FROM oceano_pedidos WHERE id = %(id)s AND cliente_id = %(cliente_id)s
+                ORDER BY tipo LIMIT 1
+            """, {'id': pedido_id, 'cliente_id': cliente_id})
             doc = cur.fetchone()
-            tipo = "Pedido"
-
-        cur.close()
+            cur.close()
         
-        if doc:
-            doc_formatado = format_db_data(dict(doc))
-            doc_formatado['tipo'] = tipo
-            return json.dumps(doc_formatado)
-        else:
-            return json.dumps({"erro": f"Nenhum orçamento ou pedido com o ID {pedido_id} foi encontrado para este cliente."})
+            if doc:
+                # Mantém só o campo que faz sentido para o tipo (chave PIX no orçamento, rastreio no pedido)
+                doc.pop('codigo_rastreio' if doc['tipo'] == 'Orçamento' else 'chave_pix')
+                return json.dumps(doc, default=json_default)
+            else:
+                return json.dumps({"erro": f"Nenhum orçamento ou pedido com o ID {pedido_id} foi encontrado para este cliente."})
             
     except Exception as e:
-        print(f"ERRO na ferramenta check_status_pedido: {e}")
+        log.error("ERRO na ferramenta check_status_pedido: %s", e)
         return json.dumps({"erro": "Erro interno ao consultar o banco de dados."})
-    finally:
-        if conn: conn.close()
 
 # [NOVA FERRAMENTA]
 def tool_get_product_list():
     """Ferramenta: Busca a lista de produtos e categorias do banco de dados para vender."""
-    print(f"[Chatbot Tool] Buscando lista de produtos...")
-    conn = None
+    log.info("[Chatbot Tool] Buscando lista de produtos...")
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        with get_db_connection() as conn:
+            cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         
-        # Agrupa produtos por categoria para uma resposta mais limpa
-        query = """
-        SELECT categoria, subcategoria, nome_produto 
-        FROM oceano_produtos 
-        WHERE categoria IS NOT NULL AND categoria != ''
-        ORDER BY categoria, subcategoria, nome_produto;
-        """
-        cur.execute(query)
-        produtos = cur.fetchall()
-        cur.close()
-
-        if not produtos:
-             return json.dumps({"erro": "Nenhum produto encontrado no catálogo."})
-
-        # Estrutura os dados para a IA
-        catalogo = collections.OrderedDict()
-        for p in produtos:
-            cat = p['categoria'] or 'Outros'
-            subcat = p['subcategoria'] or 'Geral'
+            # Agrupa produtos por categoria para uma resposta mais limpa
+            query = """
+            SELECT categoria, subcategoria, nome_produto 
+            FROM oceano_produtos 
+            WHERE categoria IS NOT NULL AND categoria != ''
+            ORDER BY categoria, subcategoria, nome_produto;
+            """
+            cur.execute(query)
+            produtos = cur.fetchall()
+            cur.close()
+
+            if not produtos:
+                 return json.dumps({"erro": "Nenhum produto encontrado no catálogo."})
+
+            # Estrutura os dados para a IA
+            catalogo = collections.OrderedDict()
+            for p in produtos:
+                cat = p['categoria'] or 'Outros'
+                subcat = p['subcategoria'] or 'Geral'
             
-            if cat not in catalogo:
-                catalogo[cat] = collections.OrderedDict()
-            if subcat not in catalogo[cat]:
-                catalogo[cat][subcat] = []
+                if cat not in catalogo:
+                    catalogo[cat] = collections.OrderedDict()
+                if subcat not in catalogo[cat]:
+                    catalogo[cat][subcat] = []
                 
-            catalogo[cat][subcat].append(p['nome_produto'])
+                catalogo[cat][subcat].append(p['nome_produto'])
         
-        # Retorna o JSON estruturado
-        return json.dumps(catalogo)
+            # Retorna o JSON estruturado
+            return json.dumps(catalogo)
             
     except Exception as e:
-        print(f"ERRO na ferramenta tool_get_product_list: {e}")
+        log.error("ERRO na ferramenta tool_get_product_list: %s", e)
         return json.dumps({"erro": "Erro interno ao consultar o catálogo de produtos."})
-    finally:
-        if conn: conn.close()
 
 
 # --- Configuração do Modelo Gemini ---
@@ -1092,6 +1531,37 @@ if GEMINI_API_KEY:
 else:
     gemini_model = None
 
+# Respostas do chatbot para conversas repetidas (mesmo cliente, histórico e mensagem), sem nova chamada ao Gemini.
+# Respostas que consultaram um pedido (check_status_pedido) dependem do cliente e nunca entram aqui.
+CHAT_CACHE_TTL = int(os.getenv('CHAT_CACHE_TTL', 600))
+_chat_cache = TTLCache(maxsize=1024, ttl=CHAT_CACHE_TTL)
+_chat_cache_lock = threading.Lock()
+
+def evento_chat(dados):
+    """Formata um evento SSE (text/event-stream) com um JSON no campo 'data'."""
+    return b'data: ' + orjson.dumps(dados) + b'\n\n'
+
+def transmitir_resposta_chat(response, chave_cache, cacheavel):
+    """Repassa ao navegador os pedaços de texto do Gemini conforme chegam; ao final guarda a resposta completa no cache."""
+    partes = []
+    try:
+        for chunk in response:
+            try:
+                texto = chunk.text
+            except ValueError:
+                continue # Pedaço sem texto (ex.: só o motivo de término)
+            if texto:
+                partes.append(texto)
+                yield evento_chat({'delta': texto})
+    except Exception as e:
+        log.exception("🔴 Erro Chatbot API (streaming): %s", e)
+        yield evento_chat({'erro': 'Desculpe, tive um problema interno ao processar sua solicitação.'})
+        return
+    if cacheavel:
+        with _chat_cache_lock:
+            _chat_cache[chave_cache] = ''.join(partes)
+    yield evento_chat({'fim': True})
+
 @app.route('/api/oceano/chat', methods=['POST'])
 @cliente_token_required
 def handle_chat(cliente_id):
@@ -1101,6 +1571,8 @@ def handle_chat(cliente_id):
     data = request.get_json()
     message = data.get('message')
     history_raw = data.get('history', [])
+    # Com 'Accept: text/event-stream' a resposta final chega em pedaços (SSE); sem ele, continua um JSON único
+    stream = 'text/event-stream' in request.headers.get('Accept', '')
     
     # Constrói o histórico para o Gemini
     chat_history = []
@@ -1116,16 +1588,31 @@ def handle_chat(cliente_id):
              chat_history.append({'role': role, 'parts': content_part})
 
 
+    consultou_pedido = False
+
     try:
+        # A chave inclui o cliente: o histórico pode trazer resultados de ferramentas com dados dos pedidos dele
+        chave_cache = hashlib.blake2b(orjson.dumps([cliente_id, history_raw, message]), digest_size=16).hexdigest()
+        with _chat_cache_lock:
+            resposta_em_cache = _chat_cache.get(chave_cache)
+        if resposta_em_cache is not None:
+            if stream:
+                return Response([evento_chat({'delta': resposta_em_cache}), evento_chat({'fim': True})],
+                                mimetype='text/event-stream')
+            return jsonify({'response': resposta_em_cache})
+
         # Inicia o chat
         chat = gemini_model.start_chat(history=chat_history)
         
         # 1. Envia a mensagem do usuário (diretamente)
-        response = chat.send_message(message)
+        response = chat.send_message(message, stream=stream)
         
-        # 2. Verifica se a IA quer usar uma ferramenta
+        # 2. Verifica se a IA quer usar uma ferramenta (no streaming, o primeiro pedaço já diz isso)
         while response.candidates[0].content.parts[0].function_call:
             function_call = response.candidates[0].content.parts[0].function_call
+            if stream:
+                # A chamada de ferramenta não vai para o navegador: termina de ler antes de responder à IA
+                response.resolve()
             
             tool_result = None
             
@@ -1136,6 +1623,7 @@ def handle_chat(cliente_id):
                 # Chama a ferramenta com o ID do cliente logado (para segurança)
                 tool_result_json = tool_check_status_pedido(pedido_id, cliente_id)
                 tool_result = json.loads(tool_result_json)
+                consultou_pedido = True
             
             # [FERRAMENTA 2 - NOVA] Obter Lista de Produtos
             elif function_call.name == "get_product_list":
@@ -1156,7 +1644,8 @@ def handle_chat(cliente_id):
                                 "response": tool_result 
                             }
                         }]
-                    }]
+                    }],
+                    stream=stream
                 )
                 # ==========================================================
             else:
@@ -1173,18 +1662,24 @@ def handle_chat(cliente_id):
                                 "response": {"erro": "Ferramenta não reconhecida."}
                             }
                         }]
-                    }]
+                    }],
+                    stream=stream
                 )
                 # ==========================================================
         
         # 4. Retorna a resposta final da IA (em texto)
+        if stream:
+            return Response(stream_with_context(transmitir_resposta_chat(response, chave_cache, not consultou_pedido)),
+                            mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
         final_response_text = response.candidates[0].content.parts[0].text
+        if not consultou_pedido:
+            with _chat_cache_lock:
+                _chat_cache[chave_cache] = final_response_text
         return jsonify({'response': final_response_text})
 
     except Exception as e:
-        # Imprime o traceback completo no console do servidor para debug
-        print(f"🔴 Erro Chatbot API: {e}")
-        traceback.print_exc()
+        # Registra o traceback completo no log do servidor para debug
+        log.exception("🔴 Erro Chatbot API: %s", e)
         return jsonify({"response": "Desculpe, tive um problema interno ao processar sua solicitação."}), 500
 
 
@@ -1192,6 +1687,28 @@ def handle_chat(cliente_id):
 # --- PARTE 6: ROTAS PÚBLICAS (Fallback) ---
 # =====================================================================
 
+def build_static_index(pasta):
+    """Lista (uma vez, na inicialização) os arquivos da pasta estática, com caminhos relativos."""
+    arquivos = set()
+    pendentes = ['']
+    while pendentes:
+        relativo = pendentes.pop()
+        try:
+            entradas = os.scandir(os.path.join(pasta, relativo))
+        except OSError:
+            continue
+        with entradas:
+            for entrada in entradas:
+                caminho = f"{relativo}/{entrada.name}" if relativo else entrada.name
+                if entrada.is_dir():
+                    pendentes.append(caminho)
+                elif entrada.is_file():
+                    arquivos.add(caminho)
+    return arquivos
+
+# Arquivos da pasta static/ conhecidos no deploy: evita um stat() no disco a cada URL desconhecida
+_STATIC_INDEX = build_static_index(app.static_folder)
+
 @app.route('/<path:path>')
 def serve_static_or_404(path):
     """
@@ -1203,15 +1720,14 @@ def serve_static_or_404(path):
     
     # Tenta servir como arquivo estático PRIMEIRO
     # (Necessário se você tiver 'logochat.png' ou 'fundo1.png' na pasta static)
-    try:
-        return send_from_directory(app.static_folder, path)
-    except Exception:
-        # Se não for um arquivo estático, é 404
-        print(f"AVISO: Rota não encontrada (404) para: {path}")
-        return "Página não encontrada", 404
+    if path in _STATIC_INDEX:
+        return send_from_directory(app.static_folder, path, conditional=True,
+                                   max_age=app.config['SEND_FILE_MAX_AGE_DEFAULT'])
+    # Se não for um arquivo estático, é 404
+    log.warning("AVISO: Rota não encontrada (404) para: %s", path)
+    return "Página não encontrada", 404
 
 # --- Execução do App ---
 if __name__ == '__main__':
-    port = int(os.environ.get("PORT", 10000))
     # Mude debug=True para desenvolvimento local
-    app.run(host="0.0.0.0", port=port, debug=False)
\ No newline at end of file
+    app.run(host="0.0.0.0", port=PORT, debug=False)
\ No newline at end of file
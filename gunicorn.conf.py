@@ -0,0 +1,25 @@
+# Configuração do Gunicorn (lida automaticamente ao rodar `gunicorn app:app` nesta pasta).
+import os
+
+# O app é praticamente todo I/O (PostgreSQL e Gemini): com workers gevent cada processo
+# atende várias requisições enquanto as outras esperam o banco ou a rede. Isso só vale para
+# o que coopera com o gevent: o psycopg2 via psycogreen (post_fork abaixo) e o Gemini pelo
+# transporte REST configurado no app.py (o gRPC padrão travaria o worker inteiro).
+worker_class = 'gevent'
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 500))
+bind = f"0.0.0.0:{os.getenv('PORT', '10000')}"
+
+
+def post_fork(server, worker):
+    # O psycopg2 é uma extensão em C e não é afetado pelo monkey patch do gevent:
+    # o psycogreen faz as queries cederem a vez para outros greenlets enquanto esperam o banco.
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
+
+
+def post_worker_init(worker):
+    # Já com o monkey patch do gevent aplicado: sobe o listener de logs deste worker (ver app.py),
+    # sem esperar o primeiro request; com --preload a thread do master não passa pelo fork.
+    from app import iniciar_log_listener
+    iniciar_log_listener()
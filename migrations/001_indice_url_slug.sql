@@ -0,0 +1,4 @@
+-- Índice para a busca de produto por slug (rota /produtos/<slug>).
+-- Executar com: psql "$DATABASE_URL" -f migrations/001_indice_url_slug.sql
+-- CONCURRENTLY não bloqueia escritas na tabela, mas não pode rodar dentro de uma transação.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_oceano_produtos_url_slug ON oceano_produtos (url_slug);
@@ -0,0 +1,24 @@
+-- Converte oceano_produtos.especificacoes_tecnicas de TEXT para JSONB.
+-- O psycopg2 passa a devolver a coluna como dict, sem json.loads a cada página de produto.
+-- Executar com: psql "$DATABASE_URL" -f migrations/002_especificacoes_jsonb.sql
+-- Reinicie o app depois: conexões abertas têm prepared statements com o tipo antigo da coluna.
+
+BEGIN;
+
+-- Textos que não são JSON válido viram {"Descrição": "<texto>"}, o mesmo fallback que a rota usava.
+CREATE FUNCTION pg_temp.texto_para_specs(valor text) RETURNS jsonb AS $$
+BEGIN
+    IF valor IS NULL OR btrim(valor) = '' THEN
+        RETURN NULL;
+    END IF;
+    RETURN valor::jsonb;
+EXCEPTION WHEN others THEN
+    RETURN jsonb_build_object('Descrição', valor);
+END;
+$$ LANGUAGE plpgsql;
+
+ALTER TABLE oceano_produtos
+    ALTER COLUMN especificacoes_tecnicas TYPE jsonb
+    USING pg_temp.texto_para_specs(especificacoes_tecnicas);
+
+COMMIT;
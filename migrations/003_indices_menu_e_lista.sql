@@ -0,0 +1,12 @@
+-- Índices para a query do menu dinâmico e para a listagem de /api/produtos.
+-- Executar com: psql "$DATABASE_URL" -f migrations/003_indices_menu_e_lista.sql
+
+-- Menu (inject_dynamic_menu): mesmo filtro e mesma ordenação da query, com url_slug incluído
+-- para permitir Index Only Scan sem etapa de Sort.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_oceano_produtos_menu
+    ON oceano_produtos (categoria, subcategoria, nome_produto) INCLUDE (url_slug)
+    WHERE categoria IS NOT NULL AND categoria <> '' AND url_slug IS NOT NULL AND url_slug <> '';
+
+-- Listagem pública (/api/produtos): ORDER BY nome_produto.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_oceano_produtos_nome
+    ON oceano_produtos (nome_produto);
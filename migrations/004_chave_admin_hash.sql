@@ -0,0 +1,5 @@
+-- A chave do admin passa a ser gravada como hash do werkzeug (scrypt, ~160 caracteres).
+-- As contas antigas em texto puro são convertidas pelo próprio app no primeiro login.
+-- Executar com: psql "$DATABASE_URL" -f migrations/004_chave_admin_hash.sql
+
+ALTER TABLE oceano_admin ALTER COLUMN chave_admin TYPE text;
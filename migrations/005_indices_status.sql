@@ -0,0 +1,5 @@
+-- Índices para os contadores do dashboard admin (filtro por status).
+-- Executar com: psql "$DATABASE_URL" -f migrations/005_indices_status.sql
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_oceano_orcamentos_status ON oceano_orcamentos (status);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_oceano_pedidos_status ON oceano_pedidos (status);
@@ -0,0 +1,6 @@
+-- Índice para a lista de pedidos do admin (ORDER BY data_atualizacao DESC, id DESC),
+-- usado também pela paginação keyset (?limit=&after=).
+-- Executar com: psql "$DATABASE_URL" -f migrations/006_indice_pedidos_lista.sql
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_oceano_pedidos_atualizacao
+    ON oceano_pedidos (data_atualizacao DESC, id DESC);
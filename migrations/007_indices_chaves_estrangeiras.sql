@@ -0,0 +1,14 @@
+-- Índices nas chaves estrangeiras (o PostgreSQL não cria índice para FK automaticamente).
+-- Executar com: psql "$DATABASE_URL" -f migrations/007_indices_chaves_estrangeiras.sql
+
+-- Itens do pedido/orçamento no detalhe do admin, na aprovação e no chatbot
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_oceano_pedido_itens_pedido
+    ON oceano_pedido_itens (pedido_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_oceano_orcamento_itens_orcamento
+    ON oceano_orcamento_itens (orcamento_id);
+
+-- Portal do cliente: listas e contadores filtram por cliente_id (e status)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_oceano_pedidos_cliente
+    ON oceano_pedidos (cliente_id, status);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_oceano_orcamentos_cliente
+    ON oceano_orcamentos (cliente_id, status);
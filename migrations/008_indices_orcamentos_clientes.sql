@@ -0,0 +1,10 @@
+-- Índices restantes para as consultas do admin e do portal.
+-- Executar com: psql "$DATABASE_URL" -f migrations/008_indices_orcamentos_clientes.sql
+
+-- Lista de orçamentos do admin (ORDER BY data_atualizacao DESC)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_oceano_orcamentos_atualizacao
+    ON oceano_orcamentos (data_atualizacao DESC);
+
+-- Login do portal do cliente (WHERE codigo_acesso = ...)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_oceano_clientes_codigo_acesso
+    ON oceano_clientes (codigo_acesso);
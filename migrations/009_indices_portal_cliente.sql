@@ -0,0 +1,8 @@
+-- Listas do portal do cliente: filtram por cliente_id e ordenam por data_atualizacao DESC.
+-- Os índices (cliente_id, status) da 007 continuam servindo os contadores do dashboard.
+-- Executar com: psql "$DATABASE_URL" -f migrations/009_indices_portal_cliente.sql
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_oceano_orcamentos_cliente_atualizacao
+    ON oceano_orcamentos (cliente_id, data_atualizacao DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_oceano_pedidos_cliente_atualizacao
+    ON oceano_pedidos (cliente_id, data_atualizacao DESC);